@@ -0,0 +1,177 @@
+import os
+import sys
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.DataProcessorOffline import SignalModel, FEATURES
+from Service.RecordingFile import CHUNKED_HEADER
+
+# Headless feature extraction over a directory of recordings. Every recording is one task
+# in a process pool; the parent streams the rows of finished recordings into one CSV table
+# (one row per recording and channel, one column per feature) and lists finished
+# recordings in "<output>.done", so a crashed or interrupted run resumes where it stopped.
+# At the end the table is also written column by column to "<output base>.npz", one array
+# per column, for loading single features without parsing the CSV.
+DEFAULT_BANDS = ((20, 50), (50, 100), (100, 200), (200, 500))
+META_COLUMNS = ["recording", "channel", "sampling_rate", "n_samples", "duration_s"]
+INT_COLUMNS = ("channel", "n_samples")
+
+
+def find_recordings(root):
+    recordings = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Recorder output (.emgrec directories) is one recording, its chunks are not walked
+        for name in sorted(dirnames):
+            if name.endswith(".emgrec") and os.path.exists(os.path.join(dirpath, name, CHUNKED_HEADER)):
+                recordings.append(os.path.join(dirpath, name))
+        dirnames[:] = [name for name in dirnames if not name.endswith(".emgrec")]
+        names = set(filenames)
+        for name in sorted(filenames):
+            base, ext = os.path.splitext(name)
+            # A converted .npy next to its .pkl is the same recording, SignalModel picks the faster one
+            if ext == ".pkl" or (ext == ".npy" and base + ".json" in names and base + ".pkl" not in names):
+                recordings.append(os.path.join(dirpath, name))
+    return sorted(recordings)
+
+
+def columns_for(bands):
+    return META_COLUMNS + list(FEATURES) + [f"power_{low:g}_{high:g}" for low, high in bands]
+
+
+def analyze_recording(path, bands=DEFAULT_BANDS):
+    model = SignalModel(path, build_pyramid=False)
+    if model.n_channels == 0:
+        raise ValueError(f"no channels loaded from {path}")
+    results = model.compute_features(features=FEATURES, bands=bands)
+    n_samples = model.signal.shape[1]
+    rows = []
+    for ch in range(model.n_channels):
+        row = {"recording": path, "channel": ch, "sampling_rate": model.fs,
+               "n_samples": n_samples, "duration_s": n_samples / model.fs}
+        row.update({name: float(values[ch]) for name, values in results.items()})
+        rows.append(row)
+    return rows
+
+
+def _read_done(done_path):
+    if not os.path.exists(done_path):
+        return set()
+    with open(done_path) as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def _prepare_output(output, columns, done):
+    # Keep only rows of recordings that were marked done, a crash may have left partial ones
+    if os.path.exists(output) and done:
+        with open(output, newline="") as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames != columns:
+                # Mixing band sets would leave finished recordings without the new columns
+                raise ValueError(f"{output} was written with columns {reader.fieldnames}, not {columns}; "
+                                 f"resume with the same --band options or start over with --no-resume")
+            kept = [row for row in reader if row.get("recording") in done]
+        tmp = output + ".tmp"
+        with open(tmp, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(kept)
+        os.replace(tmp, output)
+    else:
+        with open(output, "w", newline="") as f:
+            csv.DictWriter(f, fieldnames=columns).writeheader()
+
+
+def columnar_path(output):
+    return os.path.splitext(output)[0] + ".npz"
+
+
+def write_columns(output, columns):
+    """Writes the CSV table as one array per column to <output base>.npz, returns its path."""
+    with open(output, newline="") as f:
+        rows = list(csv.DictReader(f))
+    arrays = {}
+    for name in columns:
+        values = [row[name] for row in rows]
+        if name == "recording":
+            arrays[name] = np.array(values, dtype=str)
+        else:
+            arrays[name] = np.array(values, dtype=np.int64 if name in INT_COLUMNS else np.float64)
+    path = columnar_path(output)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def run_batch(root, output, workers=None, bands=DEFAULT_BANDS, resume=True):
+    done_path = output + ".done"
+    recordings = find_recordings(root)
+    if not resume:
+        for path in (output, done_path):
+            if os.path.exists(path):
+                os.remove(path)
+    done = _read_done(done_path)
+    columns = columns_for(bands)
+    _prepare_output(output, columns, done)
+    pending = [path for path in recordings if path not in done]
+    total = len(recordings)
+    print(f"[Batch] {time.strftime('%H:%M:%S')} {total} recordings found, {len(done & set(recordings))} already done, {len(pending)} to process with {workers or os.cpu_count()} workers")
+    if not pending:
+        write_columns(output, columns)
+        return 0
+
+    failed = 0
+    finished = total - len(pending)
+    t0 = time.perf_counter()
+    with open(output, "a", newline="") as out, open(done_path, "a") as done_file, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(out, fieldnames=columns)
+        futures = {pool.submit(analyze_recording, path, bands): path for path in pending}
+        for n, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[Batch] {time.strftime('%H:%M:%S')} Failed {path}: {e}")
+                continue
+            writer.writerows(rows)
+            out.flush()
+            os.fsync(out.fileno())
+            done_file.write(path + "\n")
+            done_file.flush()
+            os.fsync(done_file.fileno())
+            finished += 1
+            elapsed = time.perf_counter() - t0
+            rate = n / elapsed if elapsed > 0 else 0.0
+            eta = (len(pending) - n) / rate if rate > 0 else 0.0
+            print(f"[Batch] {time.strftime('%H:%M:%S')} {finished}/{total} {os.path.basename(path)}, {rate:.2f} rec/s, ETA {eta:.0f} s")
+    columnar = write_columns(output, columns)
+    print(f"[Batch] {time.strftime('%H:%M:%S')} Finished, {finished}/{total} recordings in {output} and {columnar}, {failed} failed")
+    return failed
+
+
+def _parse_band(text):
+    low, high = text.split("-")
+    return float(low), float(high)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Extract per-channel EMG features from a directory of recordings")
+    parser.add_argument("directory", help="searched recursively for .pkl recordings, converted .npy files and .emgrec directories")
+    parser.add_argument("-o", "--output", default="features.csv", help="CSV table, one row per recording and channel")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes, defaults to all cores")
+    parser.add_argument("--band", type=_parse_band, action="append", default=None,
+                        help="PSD band power column as LOW-HIGH in Hz, repeatable")
+    parser.add_argument("--no-resume", action="store_true", help="start over instead of skipping finished recordings")
+    args = parser.parse_args()
+    bands = tuple(args.band) if args.band else DEFAULT_BANDS
+    try:
+        failed = run_batch(args.directory, args.output, args.workers, bands, resume=not args.no_resume)
+    except ValueError as e:
+        print(f"[Batch] {time.strftime('%H:%M:%S')} Cannot resume: {e}")
+        sys.exit(2)
+    sys.exit(1 if failed else 0)
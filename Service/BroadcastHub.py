@@ -0,0 +1,167 @@
+import os
+import sys
+import threading
+from collections import deque
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.EMGProtocol import encode_frame
+from Service.Metrics import REGISTRY
+
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+BYTES_QUEUED = REGISTRY.counter("emg_server_bytes_total", "Frame bytes put into client send queues")
+FRAMES_DROPPED = REGISTRY.counter("emg_server_dropped_frames_total", "Frames dropped by full client queues")
+QUEUE_DEPTH = REGISTRY.gauge("emg_server_queue_depth", "Deepest client send queue after the last publish")
+CLIENTS = REGISTRY.gauge("emg_server_clients", "Registered clients")
+
+
+class ClientQueue:
+    """Bounded send queue of one client.
+
+    When the queue is full the overflow policy decides: drop-oldest discards the
+    oldest queued packet, drop-newest discards the new one, disconnect closes the
+    queue so the client's sender drops the connection. The producer never blocks.
+    """
+
+    def __init__(self, maxsize=64, policy=DROP_OLDEST, on_ready=None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {OVERFLOW_POLICIES}")
+        self.items = deque()
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_ready = on_ready  # wakes up an asyncio sender, threaded senders wait on the condition
+        self.condition = threading.Condition()
+        self.closed = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item):
+        with self.condition:
+            if self.closed:
+                return False
+            if len(self.items) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return True
+                if self.policy == DISCONNECT:
+                    self.closed = True
+                    self.condition.notify_all()
+                    if self.on_ready:
+                        self.on_ready()
+                    return False
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.condition.notify()
+        if self.on_ready:
+            self.on_ready()
+        return True
+
+    def get(self, timeout=None):
+        # Returns None on timeout or when the queue was closed and is empty
+        with self.condition:
+            if not self.items and not self.closed:
+                self.condition.wait(timeout)
+            return self.items.popleft() if self.items else None
+
+    def get_nowait(self):
+        with self.condition:
+            return self.items.popleft() if self.items else None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.on_ready:
+            self.on_ready()
+
+    def depth(self):
+        return len(self.items)
+
+
+class BroadcastHub:
+    """Fans every produced frame out to the bounded queues of all connected clients.
+
+    publish() receives the full (channels, samples) frame once; each distinct
+    subscription mask and payload encoding is serialized once per frame and the bytes
+    are shared by all clients with that combination. Sequence numbers are global, so packets dropped by a
+    client's queue show up as gaps on that client.
+    """
+
+    def __init__(self, queue_size=64, policy=DROP_OLDEST):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {OVERFLOW_POLICIES}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.seq = 0
+
+    def register(self, session, on_ready=None):
+        queue = ClientQueue(self.queue_size, self.policy, on_ready)
+        session.queue = queue
+        with self.lock:
+            self.sessions[session] = queue
+            CLIENTS.set(len(self.sessions))
+        return queue
+
+    def unregister(self, session):
+        with self.lock:
+            queue = self.sessions.pop(session, None)
+            CLIENTS.set(len(self.sessions))
+        if queue is not None:
+            queue.close()
+
+    def close_all(self):
+        # Wakes every blocked sender, used on shutdown
+        with self.lock:
+            queues = list(self.sessions.values())
+        for queue in queues:
+            queue.close()
+
+    def send_to(self, session, data: bytes):
+        # Control replies go through the same queue to keep ordering with data frames
+        return session.queue.put(data)
+
+    def publish(self, frame, timestamp_ns):
+        with self.lock:
+            sessions = list(self.sessions.items())
+        encoded = {}
+        delivered = 0
+        depth = 0
+        for session, queue in sessions:
+            mask, channels = session.subscription  # one read, a command thread may replace it meanwhile
+            codec = session.codec
+            if session.paused or not channels:
+                continue
+            key = (mask, codec)  # codecs are shared per encoding name
+            data = encoded.get(key)
+            if data is None:
+                data = encode_frame(mask, frame[channels], self.seq, timestamp_ns, codec)
+                encoded[key] = data
+            enqueued, dropped = queue.enqueued, queue.dropped
+            if queue.put(data):
+                delivered += 1
+            BYTES_QUEUED.inc(len(data) * (queue.enqueued - enqueued))
+            FRAMES_DROPPED.inc(queue.dropped - dropped)
+            depth = max(depth, queue.depth())
+        QUEUE_DEPTH.set(depth)
+        self.seq += 1
+        return delivered
+
+    def client_stats(self):
+        with self.lock:
+            sessions = list(self.sessions.items())
+        return [{
+            "address": session.address,
+            "depth": queue.depth(),
+            "max_depth": queue.max_depth,
+            "enqueued": queue.enqueued,
+            "dropped": queue.dropped,
+            "closed": queue.closed,
+        } for session, queue in sessions]
@@ -0,0 +1,141 @@
+import time
+import zlib
+import numpy as np
+from Service.Metrics import REGISTRY
+
+try:
+    import zstandard
+except ImportError:  # optional, "+zstd" encodings are refused without it
+    zstandard = None
+
+# Payload encodings of data frames, selected per client with the "encoding:<name>" command.
+# The header's encoding byte holds the sample format in the low nibble and the compressor
+# in the high nibble. Names are "<format>" or "<format>+<compressor>", e.g. "int16-delta+zlib".
+#   float32      n_channels x n_samples float32, the default
+#   int16        float32 scale per channel, then int16 samples; sample = q * scale, the
+#                scale maps the channel's peak in the frame to 32767 (error <= scale / 2)
+#   int16-delta  as int16, but every sample after the first is stored as the (wrapping)
+#                int16 difference to its predecessor, which compresses much better
+ENCODING_FLOAT32 = 0
+ENCODING_INT16 = 1
+ENCODING_INT16_DELTA = 2
+FORMATS = {"float32": ENCODING_FLOAT32, "int16": ENCODING_INT16, "int16-delta": ENCODING_INT16_DELTA}
+COMPRESS_ZLIB = 0x10
+COMPRESS_ZSTD = 0x20
+COMPRESSORS = {"zlib": COMPRESS_ZLIB, "zstd": COMPRESS_ZSTD}
+DEFAULT_ENCODING = "float32"
+CODEC_BUCKETS = (1e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 5e-3)
+
+
+class CodecError(ValueError):
+    pass
+
+
+def available_encodings():
+    compressors = [name for name in COMPRESSORS if name != "zstd" or zstandard is not None]
+    return list(FORMATS) + [f"{fmt}+{comp}" for fmt in FORMATS for comp in compressors]
+
+
+class Codec:
+    """Encodes (n_channels, n_samples) blocks to payload bytes and back, vectorized over all channels.
+
+    Encode/decode time and payload vs. float32 bytes go to per-codec metrics, so the
+    bandwidth saving and the CPU cost of an encoding can be read from the scrape endpoint.
+    """
+
+    def __init__(self, name, level=1):
+        fmt, _, compressor = name.partition("+")
+        if fmt not in FORMATS or (compressor and compressor not in COMPRESSORS):
+            raise CodecError(f"Unknown encoding '{name}', expected one of {available_encodings()}")
+        if compressor == "zstd" and zstandard is None:
+            raise CodecError("zstd compression needs the zstandard package")
+        self.name = name
+        self.format = FORMATS[fmt]
+        self.compressor = COMPRESSORS.get(compressor, 0)
+        self.id = self.format | self.compressor
+        self.level = level
+        metric = "emg_codec_" + name.replace("-", "_").replace("+", "_")
+        self.encode_seconds = REGISTRY.histogram(metric + "_encode_seconds", f"Time to encode one {name} payload", CODEC_BUCKETS)
+        self.decode_seconds = REGISTRY.histogram(metric + "_decode_seconds", f"Time to decode one {name} payload", CODEC_BUCKETS)
+        self.raw_bytes = REGISTRY.counter(metric + "_raw_bytes_total", "float32 size of the encoded samples")
+        self.encoded_bytes = REGISTRY.counter(metric + "_bytes_total", f"{name} payload bytes")
+
+    def encode(self, block: np.ndarray):
+        t0 = time.perf_counter()
+        if self.format == ENCODING_FLOAT32:
+            payload = block.astype(np.float32, copy=False).tobytes()
+        else:
+            scale, q = quantize_int16(block)
+            if self.format == ENCODING_INT16_DELTA:
+                q[:, 1:] = np.diff(q, axis=1)  # int16 arithmetic wraps, the cumsum on decode wraps back
+            payload = scale.tobytes() + q.tobytes()
+        if self.compressor == COMPRESS_ZLIB:
+            payload = zlib.compress(payload, self.level)
+        elif self.compressor == COMPRESS_ZSTD:
+            payload = zstandard.ZstdCompressor(level=self.level).compress(payload)
+        self.encode_seconds.observe(time.perf_counter() - t0)
+        self.raw_bytes.inc(block.size * 4)
+        self.encoded_bytes.inc(len(payload))
+        return payload
+
+    def decode(self, payload, n_channels: int, n_samples: int):
+        t0 = time.perf_counter()
+        try:
+            if self.compressor == COMPRESS_ZLIB:
+                payload = zlib.decompress(payload)
+            elif self.compressor == COMPRESS_ZSTD:
+                payload = zstandard.ZstdDecompressor().decompress(payload)
+            count = n_channels * n_samples
+            if self.format == ENCODING_FLOAT32:
+                block = np.frombuffer(payload, dtype=np.float32, count=count).reshape(n_channels, n_samples).copy()
+            else:
+                scale = np.frombuffer(payload, dtype=np.float32, count=n_channels)
+                q = np.frombuffer(payload, dtype=np.int16, count=count, offset=n_channels * 4).reshape(n_channels, n_samples)
+                if self.format == ENCODING_INT16_DELTA:
+                    q = np.cumsum(q, axis=1, dtype=np.int16)
+                block = q.astype(np.float32)
+                block *= scale[:, np.newaxis]
+            if len(payload) != expected_size(self.format, n_channels, n_samples):
+                raise CodecError(f"{self.name} payload of {len(payload)} bytes for {n_channels} x {n_samples} samples")
+        except (ValueError, zlib.error) as e:
+            raise CodecError(f"Cannot decode {self.name} payload: {e}") from e
+        self.decode_seconds.observe(time.perf_counter() - t0)
+        return block
+
+
+def quantize_int16(block: np.ndarray):
+    """(scale per channel, int16 samples) with the peak of every channel at +-32767."""
+    block = block.astype(np.float32, copy=False)
+    peak = np.abs(block).max(axis=1)
+    scale = np.where(peak > 0, peak / 32767.0, 1.0).astype(np.float32)
+    q = np.rint(block / scale[:, np.newaxis]).astype(np.int16)
+    return scale, q
+
+
+def expected_size(fmt, n_channels, n_samples):
+    if fmt == ENCODING_FLOAT32:
+        return n_channels * n_samples * 4
+    return n_channels * 4 + n_channels * n_samples * 2
+
+
+_codecs = {}
+
+
+def get_codec(name):
+    """Shared Codec for an encoding name, raises CodecError for unknown or unavailable ones."""
+    codec = _codecs.get(name)
+    if codec is None:
+        codec = _codecs[name] = Codec(name)
+        _codecs[codec.id] = codec
+    return codec
+
+
+def codec_for_id(encoding_id):
+    codec = _codecs.get(encoding_id)
+    if codec is not None:
+        return codec
+    fmt = {v: k for k, v in FORMATS.items()}.get(encoding_id & 0x0F)
+    compressor = {v: k for k, v in COMPRESSORS.items()}.get(encoding_id & 0xF0)
+    if fmt is None or (encoding_id & 0xF0 and compressor is None):
+        raise CodecError(f"Unknown payload encoding {encoding_id:#x}")
+    return get_codec(f"{fmt}+{compressor}" if compressor else fmt)
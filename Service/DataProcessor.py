@@ -1,53 +1,112 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.RingBuffer import MultiChannelRingBuffer
+from Service.Metrics import REGISTRY, RateLimitedLogger
+from Service.Tracing import TRACER
+from Service.Recorder import StreamRecorder
 from PyQt5.QtCore import QObject, pyqtSignal
 import numpy as np
 import time
 
+PACKETS_PROCESSED = REGISTRY.counter("emg_processor_packets_total", "Frames stored in the ring buffer")
+INVALID_FRAMES = REGISTRY.counter("emg_processor_invalid_frames_total", "Frames rejected for a short or malformed payload")
+BUFFERED_SAMPLES = REGISTRY.gauge("emg_processor_buffered_samples", "Samples per channel held in the ring buffer")
+
 class DataProcessor(QObject):
-    data_updated = pyqtSignal(np.ndarray)
+    data_updated = pyqtSignal(np.ndarray)  # current channel, (18,)
+    frame_updated = pyqtSignal(np.ndarray, object)  # every subscribed channel, (len(channels), 18)
     status_updated = pyqtSignal(bool, str)
 
     def __init__(self, tcp_service, parent=None):
         super().__init__(parent)
         self.tcp_service = tcp_service
         self.current_channel = 0
+        self.channels = []
         self.paused = False
-        self.buffer = []
-        self.full_data = []
+        self.capacity = 1 << 15  # samples per channel kept for windowed reads, ~16 s at 2 kHz
+        self.ring = MultiChannelRingBuffer(0, self.capacity)
+        self.read_index = 0  # absolute sample number get_realtime_data continues from
         self.sample_count = 0
-        self.max_samples = 1000
         self.packet_count = 0
+        self.log = RateLimitedLogger("DataProcessor", interval=5.0)
+        self.recorder = None  # StreamRecorder while recording
 
         self.tcp_service.data_received.connect(self.process_chunk)
         self.tcp_service.connection_status.connect(self.handle_connection_status)
+        self.tcp_service.stream_info.connect(self.handle_stream_info)
 
-    def process_chunk(self, data: np.ndarray):
-        if data.shape != (18,):
-            print(f"[DataProcessor] {time.strftime('%H:%M:%S')} Invalid data shape: {data.shape}, Channel: Ch {self.current_channel}")
+    def process_chunk(self, frame: np.ndarray, header):
+        TRACER.enter(header.seq, "processor")
+        channels = header.channels
+        if frame.ndim != 2 or frame.shape != (len(channels), 18):
+            INVALID_FRAMES.inc()
+            self.log.log("invalid", f"Invalid data shape: {frame.shape}, Channels: {len(channels)}")
             return
+        if channels != self.channels:
+            # Subscription changed, rows of the stored samples no longer line up
+            self.ring.reset(len(channels))
+            self.read_index = 0
+            self.channels = list(channels)
+        if self.recorder is not None:
+            # While recording, a display pause does not pause the stream (see toggle_pause of the
+            # view model), so frames keep arriving here and are recorded without gaps
+            self.recorder.submit(frame, header)
         if not self.paused:
-            min_val, max_val = np.min(data), np.max(data)
-            if self.packet_count % 50 == 0:
-             print(f"[DataProcessor] {time.strftime('%H:%M:%S')} Received data for Ch {self.current_channel}, Shape: {data.shape}, Amplitude: [{min_val:.2f}, {max_val:.2f}]")
-            self.buffer.append(data.copy())
-            self.full_data.append(data.copy())
+            self.ring.append(frame)
             self.sample_count += 18
             self.packet_count += 1
-            if self.packet_count % 100 == 0:
-                print(f"[DataProcessor] {time.strftime('%H:%M:%S')} Processed packet {self.packet_count}, Channel: Ch {self.current_channel}, Total samples: {self.sample_count}")
-            self.data_updated.emit(data)
-            if len(self.full_data) > self.max_samples:
-                self.full_data = self.full_data[-self.max_samples:]
+            PACKETS_PROCESSED.inc()
+            BUFFERED_SAMPLES.set(self.ring.available)
+            self.log.log("packet", f"Processed packet {self.packet_count}, Channels: {len(channels)}, Channel: Ch {self.current_channel}, Total samples: {self.sample_count}")
+            self.frame_updated.emit(frame, self.channels)
+            row = self.channel_row(self.current_channel)
+            if row is not None:
+                self.data_updated.emit(frame[row])
+
+    def channel_row(self, channel: int):
+        try:
+            return self.channels.index(channel)
+        except ValueError:
+            return None
 
     def get_realtime_data(self, channel: int):
-        if channel != self.current_channel:
+        # Samples of one channel that arrived since the previous call, as a view into the ring
+        row = self.channel_row(channel)
+        if row is None:
             return np.array([])
-        data = np.concatenate(self.buffer) if self.buffer else np.array([])
-        self.buffer.clear()
-        return data
+        _, data = self.ring.since(self.read_index)
+        self.read_index = self.ring.total
+        return data[row]
+
+    def get_latest(self, n: int, channel: int = None):
+        """View of the newest n samples, (channels, n) or (n,) for one channel."""
+        data = self.ring.latest(n)
+        if channel is None:
+            return data
+        row = self.channel_row(channel)
+        return data[row] if row is not None else np.array([])
+
+    def get_since(self, index: int):
+        """(first_index, view) of every stored sample from absolute sample number index on."""
+        return self.ring.since(index)
+
+    def start_recording(self, directory, **options):
+        """Starts writing every received frame below directory, options go to StreamRecorder."""
+        self.stop_recording()
+        options.setdefault("sampling_rate", self.tcp_service.sampling_rate or 2000)
+        self.recorder = StreamRecorder(directory, **options)
+        self.recorder.start()
+        return self.recorder
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            recorder, self.recorder = self.recorder, None
+            recorder.stop()
 
     def clear_full_data(self):
-        self.buffer.clear()
-        self.full_data.clear()
+        self.ring.reset()
+        self.read_index = 0
         self.sample_count = 0
         self.packet_count = 0
         print(f"[DataProcessor] {time.strftime('%H:%M:%S')} Cleared buffers, Channel: Ch {self.current_channel}")
@@ -57,5 +116,9 @@ class DataProcessor(QObject):
         self.status_updated.emit(not self.paused, "Paused" if self.paused else "Resumed")
         print(f"[DataProcessor] {time.strftime('%H:%M:%S')} State changed: {'Paused' if self.paused else 'Running'}, Channel: Ch {self.current_channel}")
 
+    def handle_stream_info(self, sampling_rate: float, n_channels: int):
+        if self.recorder is not None:
+            self.recorder.set_sampling_rate(sampling_rate)
+
     def handle_connection_status(self, status: bool, message: str):
         self.status_updated.emit(status, message)
\ No newline at end of file
@@ -1,76 +1,261 @@
 import os
-import pickle
+import sys
+from functools import lru_cache
 import numpy as np
-from scipy.fft import fft, fftfreq
-from scipy.signal import butter, filtfilt
+from scipy.fft import rfft, rfftfreq
+from scipy.signal import butter, filtfilt, welch, get_window
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.RecordingFile import load_recording
+from Service.Decimation import MinMaxPyramid
+from Service.SignalCache import ByteBudgetCache
+
+
+@lru_cache(maxsize=64)
+def bandpass_coefficients(order, lowcut, highcut, fs):
+    nyq = 0.5 * fs
+    return butter(order, [lowcut / nyq, highcut / nyq], btype='band')
+
+
+FEATURES = ("rms", "mav", "wl", "zc", "ssc", "mnf", "mdf")
+TIME_FEATURES = ("rms", "mav", "wl", "zc", "ssc")
+FREQUENCY_FEATURES = ("mnf", "mdf")
+
+
+def extract_features(signal, fs, features=FEATURES, nperseg=512, chunk_samples=1 << 18, bands=()):
+    """Features of every channel of a (channels, samples) array in one chunked, vectorized pass.
+
+    rms: root mean square, mav: mean absolute value, wl: waveform length,
+    zc: zero crossings, ssc: slope sign changes, mnf/mdf: mean/median frequency of the
+    Welch PSD. Each (low, high) in bands adds "power_<low>_<high>", the PSD integrated
+    over that band. Returns {name: (channels,) array}.
+    """
+    n_channels, n_samples = signal.shape
+    sumsq = np.zeros(n_channels)
+    sumabs = np.zeros(n_channels)
+    wl = np.zeros(n_channels)
+    zc = np.zeros(n_channels)
+    ssc = np.zeros(n_channels)
+    psd_sum, freqs, n_segments = None, None, 0
+    want_time = any(f in TIME_FEATURES for f in features)
+    want_freq = any(f in FREQUENCY_FEATURES for f in features) or bool(bands)
+    # Whole segments per chunk, and at least one
+    chunk_samples = max(nperseg, chunk_samples - chunk_samples % nperseg)
+    prev = None
+    for start in range(0, n_samples, chunk_samples):
+        x = np.asarray(signal[:, start:start + chunk_samples], dtype=np.float64)
+        if want_time:
+            sumsq += np.einsum('ij,ij->i', x, x)
+            sumabs += np.abs(x).sum(axis=1)
+            # Carry the last two samples so pairs and triples across chunk borders are counted once
+            ext = x if prev is None else np.concatenate([prev, x], axis=1)
+            pairs = ext if prev is None else ext[:, 1:]
+            d = np.diff(ext, axis=1)
+            wl += np.abs(np.diff(pairs, axis=1)).sum(axis=1)
+            zc += (pairs[:, :-1] * pairs[:, 1:] < 0).sum(axis=1)
+            ssc += (d[:, :-1] * d[:, 1:] < 0).sum(axis=1)
+            prev = ext[:, -2:]
+        # Welch needs at least two samples per segment, shorter inputs fall through to the zero spectrum below
+        if want_freq and x.shape[1] >= max(2, min(nperseg, n_samples)):
+            seg = min(nperseg, x.shape[1])
+            noverlap = seg // 2
+            freqs, psd = welch(x, fs=fs, window='hann', nperseg=seg, noverlap=noverlap, axis=-1)
+            count = (x.shape[1] - seg) // (seg - noverlap) + 1  # segments welch averaged
+            psd_sum = psd * count if psd_sum is None else psd_sum + psd * count
+            n_segments += count
+    n = max(n_samples, 1)
+    results = {}
+    if "rms" in features:
+        results["rms"] = np.sqrt(sumsq / n)
+    if "mav" in features:
+        results["mav"] = sumabs / n
+    if "wl" in features:
+        results["wl"] = wl
+    if "zc" in features:
+        results["zc"] = zc
+    if "ssc" in features:
+        results["ssc"] = ssc
+    band_names = [f"power_{low:g}_{high:g}" for low, high in bands]
+    if want_freq:
+        if psd_sum is None:
+            results.update({f: np.zeros(n_channels) for f in FREQUENCY_FEATURES if f in features})
+            results.update({name: np.zeros(n_channels) for name in band_names})
+        else:
+            psd = psd_sum / n_segments
+            total = psd.sum(axis=1)
+            safe_total = np.where(total > 0, total, 1.0)
+            if "mnf" in features:
+                results["mnf"] = (psd * freqs).sum(axis=1) / safe_total
+            if "mdf" in features:
+                cumulative = np.cumsum(psd, axis=1)
+                results["mdf"] = freqs[np.argmax(cumulative >= cumulative[:, -1:] / 2, axis=1)]
+            df = freqs[1] - freqs[0] if len(freqs) > 1 else 0.0
+            for name, (low, high) in zip(band_names, bands):
+                in_band = (freqs >= low) & (freqs < high)
+                results[name] = psd[:, in_band].sum(axis=1) * df
+    return results
+
 
 class SignalModel:
-    def __init__(self, pkl_path=None, fs=2000):
+    def __init__(self, pkl_path=None, fs=2000, cache_bytes=256 * 1024 * 1024, build_pyramid=True):
         self.fs = fs
+        self.build_pyramid = build_pyramid
+        # Filtered channels keyed by (channel, lowcut, highcut, order, fs), least recently used evicted first
+        self.filter_cache = ByteBudgetCache(cache_bytes)
+        # Spectra and spectrogram tiles of the selected ranges
+        self.analysis_cache = ByteBudgetCache(cache_bytes // 4)
+        self.spectrogram_tile_frames = 64
         self.channel_data = []
-        self.channel_time = []
         self.n_channels = 0
+        self.signal = None
+        self.pyramid = None
         base = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
         self.pkl_path = pkl_path or os.path.join(base, "others", "recording.pkl")
         self._load_data()
 
     def _load_data(self):
         try:
-            with open(self.pkl_path, "rb") as f:
-                rec = pickle.load(f)
-            if "device_information" not in rec or "biosignal" not in rec:
-                raise ValueError("Invalid pkl file format: missing 'device_information' or 'biosignal'.")
-            info = rec["device_information"]
-            self.n_channels = info["number_of_biosignal_channels"]
-            self.fs = info.get("sampling_frequency", self.fs)
-            sig_all = rec["biosignal"]
-            sig = sig_all[:self.n_channels]
-            C, M, K = sig.shape
-            total_samples = M * K
-            self.channel_data = [sig[c].T.reshape(-1) for c in range(C)]
-            self.channel_time = [np.arange(total_samples) / self.fs for _ in range(C)]
-            print(f"[SignalModel] Loaded data from {self.pkl_path}, Shape: ({self.n_channels}, {total_samples}), Sampling rate: {self.fs} Hz")
+            # Converted recordings (see RecordingFile.convert_pkl) are memory-mapped, channel rows are views
+            rec = load_recording(self.pkl_path, self.fs)
+            self.n_channels = rec.n_channels
+            self.fs = rec.sampling_rate or self.fs
+            total_samples = rec.n_samples
+            self.signal = rec.signal
+            self.channel_data = [rec.signal[c] for c in range(self.n_channels)]
+            # Zoomed-out views are served from a min/max pyramid built in the background
+            self.pyramid = MinMaxPyramid(self.signal)
+            if self.build_pyramid:
+                self.pyramid.build_async()
+            print(f"[SignalModel] Loaded data from {rec.path}, Shape: ({self.n_channels}, {total_samples}), Sampling rate: {self.fs} Hz")
         except FileNotFoundError:
             print(f"[SignalModel] Error: File {self.pkl_path} not found.")
             self.channel_data = []
-            self.channel_time = []
             self.n_channels = 0
         except Exception as e:
             print(f"[SignalModel] Error loading data: {str(e)}")
             self.channel_data = []
-            self.channel_time = []
             self.n_channels = 0
 
+    def _sample_range(self, time_start: float, time_end: float):
+        # Samples k with time_start <= k / fs <= time_end, computed from the indices, no time vector
+        i0 = max(0, int(np.ceil(time_start * self.fs - 1e-9)))
+        i1 = min(self.signal.shape[1], int(np.floor(time_end * self.fs + 1e-9)) + 1)
+        return i0, max(i0, i1)
+
     def get_channel_data(self, ch_idx: int, time_start: float, time_end: float):
         if ch_idx < 0 or ch_idx >= self.n_channels or not self.channel_data:
             return np.array([]), np.array([])
-        t = self.channel_time[ch_idx]
-        data = self.channel_data[ch_idx]
-        indices = (t >= time_start) & (t <= time_end)
-        return t[indices], data[indices]
+        i0, i1 = self._sample_range(time_start, time_end)
+        # data is a view into the (memory-mapped) signal, only the slice gets a time axis
+        return np.arange(i0, i1) / self.fs, self.channel_data[ch_idx][i0:i1]
+
+    @property
+    def duration(self):
+        return self.signal.shape[1] / self.fs if self.signal is not None else 0.0
+
+    def get_channel_envelope(self, ch_idx: int, time_start: float, time_end: float, n_pixels: int):
+        # Min/max envelope of the range with 2 * n_pixels points, cost independent of the range length
+        if ch_idx < 0 or ch_idx >= self.n_channels or self.pyramid is None:
+            return np.array([]), np.array([])
+        i0, i1 = self._sample_range(time_start, time_end)
+        idx, values = self.pyramid.envelope(ch_idx, i0, i1, n_pixels)
+        return idx / self.fs, values
+
+    def compute_features(self, time_start=None, time_end=None, features=FEATURES, bands=()):
+        # All channels at once, memoized per (range, feature set); the whole recording if no range is given
+        if not self.channel_data:
+            return {f: np.array([]) for f in features}
+        if time_start is None or time_end is None:
+            i0, i1 = 0, self.signal.shape[1]
+        else:
+            i0, i1 = self._sample_range(time_start, time_end)
+        features = tuple(features)
+        bands = tuple(tuple(band) for band in bands)
+
+        def compute():
+            return extract_features(self.signal[:, i0:i1], self.fs, features, bands=bands)
+        return self.analysis_cache.get_or_compute(("features", i0, i1, features, bands, self.fs), compute)
 
     def compute_rms(self, ch_idx: int):
         if ch_idx < 0 or ch_idx >= self.n_channels or not self.channel_data:
             return 0.0
-        d = self.channel_data[ch_idx]
-        return float(np.sqrt(np.mean(d ** 2)))
+        return float(self.compute_features(features=("rms",))["rms"][ch_idx])
 
-    def compute_spectrum(self, ch_idx: int):
+    def compute_spectrum(self, ch_idx: int, time_start=None, time_end=None, nperseg=512):
+        # Welch PSD (averaged rfft periodograms) of the range, the whole recording if no range is given
         if ch_idx < 0 or ch_idx >= self.n_channels or not self.channel_data:
             return np.array([]), np.array([])
-        data = self.channel_data[ch_idx]
-        n = len(data)
-        yf = fft(data)
-        xf = fftfreq(n, 1 / self.fs)[:n // 2]
-        power = np.abs(yf)[:n // 2] ** 2
-        return xf, power
+        if time_start is None or time_end is None:
+            i0, i1 = 0, self.signal.shape[1]
+        else:
+            i0, i1 = self._sample_range(time_start, time_end)
+        if i1 - i0 < 2:
+            return np.array([]), np.array([])
+        nperseg = min(nperseg, i1 - i0)
+
+        def compute():
+            return welch(self.channel_data[ch_idx][i0:i1], fs=self.fs, window='hann', nperseg=nperseg)
+        return self.analysis_cache.get_or_compute(("psd", ch_idx, i0, i1, nperseg, self.fs), compute)
+
+    def _spectrogram_tile(self, ch_idx: int, tile: int, nperseg: int, hop: int):
+        # Fixed tiles of spectrogram_tile_frames STFT frames, any range is assembled from cached tiles
+        def compute():
+            n_frames = self.spectrogram_tile_frames
+            s0 = tile * n_frames * hop
+            segment = np.asarray(self.channel_data[ch_idx][s0:s0 + (n_frames - 1) * hop + nperseg], dtype=np.float64)
+            available = (len(segment) - nperseg) // hop + 1 if len(segment) >= nperseg else 0
+            if available <= 0:
+                return np.zeros((nperseg // 2 + 1, 0), dtype=np.float32)
+            frames = np.lib.stride_tricks.sliding_window_view(segment, nperseg)[::hop][:available]
+            window = get_window('hann', nperseg)
+            spectrum = np.abs(rfft((frames - frames.mean(axis=1, keepdims=True)) * window, axis=1)) ** 2
+            spectrum /= self.fs * np.sum(window ** 2)
+            spectrum[:, 1:-1] *= 2  # one-sided density, like welch
+            return spectrum.T.astype(np.float32)
+        return self.analysis_cache.get_or_compute(("stft", ch_idx, tile, nperseg, hop, self.fs), compute)
+
+    def compute_spectrogram(self, ch_idx: int, time_start: float, time_end: float, nperseg=256, max_columns=None):
+        """(times, freqs, power) STFT power density of the range, power shaped (freqs, frames).
+
+        With max_columns, neighbouring frames are averaged so at most max_columns remain.
+        """
+        empty = (np.array([]), np.array([]), np.zeros((0, 0)))
+        if ch_idx < 0 or ch_idx >= self.n_channels or not self.channel_data:
+            return empty
+        hop = nperseg // 2
+        i0, i1 = self._sample_range(time_start, time_end)
+        f0 = -(-i0 // hop)
+        f1 = (i1 - nperseg) // hop + 1
+        if f1 <= f0:
+            return empty
+        n_frames = self.spectrogram_tile_frames
+        tiles = [self._spectrogram_tile(ch_idx, tile, nperseg, hop)
+                 for tile in range(f0 // n_frames, (f1 - 1) // n_frames + 1)]
+        offset = f0 - (f0 // n_frames) * n_frames
+        power = np.concatenate(tiles, axis=1)[:, offset:offset + (f1 - f0)]
+        frame_idx = np.arange(f0, f0 + power.shape[1])
+        if max_columns and power.shape[1] > max_columns:
+            edges = (np.arange(max_columns) * power.shape[1]) // max_columns
+            counts = np.diff(np.append(edges, power.shape[1]))
+            power = np.add.reduceat(power, edges, axis=1) / counts
+            frame_idx = frame_idx[edges] + (counts - 1) / 2.0
+        times = (frame_idx * hop + nperseg / 2) / self.fs
+        freqs = rfftfreq(nperseg, 1 / self.fs)
+        return times, freqs, power
 
     def apply_bandpass_filter(self, ch_idx: int, lowcut=20, highcut=500, order=4):
         if ch_idx < 0 or ch_idx >= self.n_channels or not self.channel_data:
             return np.array([])
-        data = self.channel_data[ch_idx]
-        nyq = 0.5 * self.fs
-        low = lowcut / nyq
-        high = highcut / nyq
-        b, a = butter(order, [low, high], btype='band')
-        return filtfilt(b, a, data)
\ No newline at end of file
+        key = (ch_idx, lowcut, highcut, order, self.fs)
+
+        def compute():
+            b, a = bandpass_coefficients(order, lowcut, highcut, self.fs)
+            return filtfilt(b, a, self.channel_data[ch_idx]).astype(np.float32)
+        return self.filter_cache.get_or_compute(key, compute)
+
+    def get_filtered_channel_data(self, ch_idx: int, time_start: float, time_end: float, lowcut=20, highcut=500, order=4):
+        # Same range as get_channel_data, zero-phase filtered over the whole channel so edges stay clean
+        if ch_idx < 0 or ch_idx >= self.n_channels or not self.channel_data:
+            return np.array([]), np.array([])
+        filtered = self.apply_bandpass_filter(ch_idx, lowcut, highcut, order)
+        i0, i1 = self._sample_range(time_start, time_end)
+        return np.arange(i0, i1) / self.fs, filtered[i0:i1]
@@ -0,0 +1,150 @@
+import os
+import sys
+import numpy as np
+from scipy.signal import butter, lfilter, lfilter_zi, sosfilt
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.EMGProtocol import SAMPLES_PER_PACKET
+from Service.RecordingFile import load_recording
+
+# Frame sources behind EMGTCPServer. The server asks for window 0, 1, 2, ... of
+# samples_per_packet samples and starts over at n_windows; every source returns a
+# C-contiguous (n_channels, samples_per_packet) float32 block.
+
+
+class DataSource:
+    n_channels = 0
+    sampling_rate = None
+    samples_per_packet = SAMPLES_PER_PACKET
+    n_windows = 0
+
+    def window(self, index):
+        raise NotImplementedError
+
+    def describe(self):
+        return f"{type(self).__name__}, Shape: ({self.n_channels}, {self.n_windows * self.samples_per_packet})"
+
+
+class RecordingSource(DataSource):
+    """Replays a recording file (see RecordingFile.load_recording), memory-mapped when converted."""
+
+    def __init__(self, path, samples_per_packet=SAMPLES_PER_PACKET):
+        self.recording = load_recording(path)
+        self.signal = self.recording.signal
+        self.sampling_rate = self.recording.sampling_rate
+        if not isinstance(self.sampling_rate, (int, float)) or self.sampling_rate <= 0:
+            raise ValueError("Invalid sampling rate")
+        self.n_channels = self.signal.shape[0]
+        self.samples_per_packet = samples_per_packet
+        self.n_windows = self.signal.shape[1] // samples_per_packet
+
+    def window(self, index):
+        start = index * self.samples_per_packet
+        return np.ascontiguousarray(self.signal[:, start:start + self.samples_per_packet], dtype=np.float32)
+
+    def describe(self):
+        return f"{self.recording.path}, Shape: {self.signal.shape}"
+
+
+class SyntheticEMGSource(DataSource):
+    """Seeded high-density surface EMG, generated in blocks of whole packets.
+
+    Channels sit on a grid of grid_columns electrodes. A few muscles under the grid
+    switch on and off with slowly varying intensity, each reaching the electrodes with
+    a Gaussian spatial gain. Every channel is band-limited noise with an EMG-like spectrum, correlated
+    with its grid neighbours, scaled by the local activation on top of an electrode noise
+    floor, plus a small powerline component. Filter and envelope states carry over between
+    blocks, so consecutive blocks form one continuous signal. The same seed always gives
+    the same samples; after n_windows the stream starts over from the seed.
+    """
+
+    def __init__(self, n_channels=256, sampling_rate=10000, duration=60.0, seed=0,
+                 samples_per_packet=SAMPLES_PER_PACKET, block_seconds=0.5, n_muscles=4,
+                 grid_columns=8, noise_floor_uv=5.0, peak_uv=300.0, powerline_hz=50.0):
+        self.n_channels = int(n_channels)
+        self.sampling_rate = sampling_rate
+        self.duration = duration
+        self.seed = seed
+        self.samples_per_packet = samples_per_packet
+        self.n_windows = max(1, int(duration * sampling_rate) // samples_per_packet)
+        self.block_windows = max(1, int(round(block_seconds * sampling_rate / samples_per_packet)))
+        self.block_samples = self.block_windows * samples_per_packet
+        self.noise_floor_uv = noise_floor_uv
+        self.peak_uv = peak_uv
+
+        layout = np.random.default_rng([seed, 1])
+        rows = np.arange(self.n_channels) // grid_columns
+        cols = np.arange(self.n_channels) % grid_columns
+        centers = layout.uniform((0, 0), (rows.max() + 1, grid_columns), size=(n_muscles, 2))
+        spread = layout.uniform(1.5, 3.0, size=n_muscles)
+        dist2 = (rows[:, None] - centers[:, 0]) ** 2 + (cols[:, None] - centers[:, 1]) ** 2
+        self.gains = np.exp(-dist2 / (2 * spread ** 2)) * layout.uniform(0.8, 1.2, size=(self.n_channels, 1))
+        self.powerline = layout.uniform(0.05, 0.2, size=(self.n_channels, 1)) * noise_floor_uv
+        phase = layout.uniform(0, 2 * np.pi, size=(self.n_channels, 1))
+        self.powerline_sin = (self.powerline * np.cos(phase)).astype(np.float32)
+        self.powerline_cos = (self.powerline * np.sin(phase)).astype(np.float32)
+        self.powerline_w = 2 * np.pi * powerline_hz / sampling_rate
+        self.neighbours = [k for k in (1, grid_columns) if k < self.n_channels]
+
+        # Carrier: unit-variance noise limited to 20-450 Hz and tilted by a 150 Hz low-pass,
+        # which puts the median frequency near 100 Hz like surface EMG
+        nyquist_cap = 0.45 * sampling_rate
+        self.sos = np.vstack([butter(2, [20, min(450, nyquist_cap)], btype="band", fs=sampling_rate, output="sos"),
+                              butter(2, min(150, nyquist_cap), fs=sampling_rate, output="sos")])
+        self.carrier_sos = self.sos.astype(np.float32)  # generated in float32, the wire format
+        impulse = np.zeros(int(sampling_rate))
+        impulse[0] = 1.0
+        mixing = 1 + 0.25 * len(self.neighbours) * 2
+        self.carrier_scale = 1.0 / np.sqrt(np.sum(sosfilt(self.sos, impulse) ** 2) * mixing)
+        # Muscle drive: AR(1) noise at packet rate with a 1 s time constant, unit variance
+        self.drive_a = 1.0 - np.exp(-samples_per_packet / sampling_rate)
+        self.drive_scale = np.sqrt((2 - self.drive_a) / self.drive_a)
+        self.reset()
+
+    def reset(self):
+        self.rng = np.random.default_rng(self.seed)
+        self.carrier_zi = np.zeros((self.sos.shape[0], self.n_channels, 2), dtype=np.float32)
+        drive_zi = lfilter_zi([self.drive_a], [1, self.drive_a - 1])
+        self.drive_zi = drive_zi[None, :] * self.rng.standard_normal((self.gains.shape[1], 1)) / self.drive_scale
+        self.next_block = 0
+        self.block_index = -1
+        self.block = None
+
+    def _generate_block(self):
+        n = self.block_samples
+        steps = self.block_windows
+        noise = self.rng.standard_normal((self.n_channels, n), dtype=np.float32)
+        mixed = noise.copy()
+        for k in self.neighbours:
+            # Volume conduction: neighbouring electrodes share part of their signal
+            mixed[k:] += 0.5 * noise[:-k]
+            mixed[:-k] += 0.5 * noise[k:]
+        carrier, self.carrier_zi = sosfilt(self.carrier_sos, mixed, axis=-1, zi=self.carrier_zi)
+
+        drive, self.drive_zi = lfilter([self.drive_a], [1, self.drive_a - 1],
+                                       self.rng.standard_normal((self.gains.shape[1], steps)),
+                                       axis=-1, zi=self.drive_zi)
+        activation = np.clip(drive * self.drive_scale - 0.3, 0, 2.0) / 1.7
+        amplitude = (self.noise_floor_uv + self.peak_uv * (self.gains @ activation)) * self.carrier_scale
+        signal = carrier
+        signal.reshape(self.n_channels, steps, self.samples_per_packet)[:] *= amplitude[:, :, None]
+
+        t = (self.next_block * n + np.arange(n)) * self.powerline_w
+        signal += self.powerline_sin * np.sin(t).astype(np.float32)
+        signal += self.powerline_cos * np.cos(t).astype(np.float32)
+        self.block = signal
+        self.block_index = self.next_block
+        self.next_block += 1
+
+    def window(self, index):
+        block, offset = divmod(index, self.block_windows)
+        if block != self.block_index:
+            if block < self.next_block:
+                self.reset()  # start over, replays the same samples from the seed
+            while self.block_index != block:
+                self._generate_block()
+        start = offset * self.samples_per_packet
+        return np.ascontiguousarray(self.block[:, start:start + self.samples_per_packet])
+
+    def describe(self):
+        return (f"synthetic EMG, {self.n_channels} channels, {self.sampling_rate:g} Hz, "
+                f"{self.duration:g} s, seed {self.seed}")
@@ -0,0 +1,172 @@
+import threading
+import time
+import numpy as np
+
+
+def minmax_envelope(data, n_bins, start=0):
+    """Reduces a 1-D array to n_bins (min, max) pairs.
+
+    Returns (indices, values) of length 2 * n_bins with min and max of every bin
+    interleaved, ready to be drawn as one line. indices are sample positions
+    relative to `start`.
+    """
+    n = len(data)
+    if n == 0:
+        return np.array([]), np.array([])
+    n_bins = max(1, min(n_bins, n))
+    edges = (np.arange(n_bins) * n) // n_bins
+    mins = np.minimum.reduceat(data, edges)
+    maxs = np.maximum.reduceat(data, edges)
+    return _interleave(edges + start, np.append(edges[1:], n) + start, mins, maxs)
+
+
+def _interleave(lo, hi, mins, maxs):
+    centers = (lo + hi - 1) / 2.0
+    x = np.repeat(centers, 2)
+    y = np.empty(2 * len(mins), dtype=np.result_type(mins, maxs))
+    y[0::2] = mins
+    y[1::2] = maxs
+    return x, y
+
+
+class MinMaxPyramid:
+    """Multi-resolution min/max decimation of a (channels, samples) signal.
+
+    Level 0 holds the min and max of every `base_block` samples, every further level
+    combines `factor` blocks of the level below. envelope() picks the coarsest level
+    whose block is not wider than a pixel, so it touches at most about
+    factor * n_pixels values whatever the length of the requested range.
+    """
+
+    def __init__(self, signal, base_block=16, factor=4, min_blocks=256, chunk_samples=1 << 20):
+        self.signal = signal
+        self.base_block = base_block
+        self.factor = factor
+        self.min_blocks = min_blocks
+        self.chunk_samples = chunk_samples - chunk_samples % base_block
+        self.n_channels, self.n_samples = signal.shape
+        self.levels = []  # list of (block_size, mins (C, n_blocks), maxs (C, n_blocks))
+        self.built_samples = 0
+        self.ready = False
+        self.thread = None
+
+    def build(self):
+        # Level 0 is filled chunk by chunk so a memory-mapped signal is streamed once
+        n_blocks = -(-self.n_samples // self.base_block)
+        dtype = self.signal.dtype
+        mins = np.empty((self.n_channels, n_blocks), dtype=dtype)
+        maxs = np.empty((self.n_channels, n_blocks), dtype=dtype)
+        for start in range(0, self.n_samples, self.chunk_samples):
+            chunk = np.asarray(self.signal[:, start:start + self.chunk_samples])
+            edges = np.arange(0, chunk.shape[1], self.base_block)
+            b0 = start // self.base_block
+            mins[:, b0:b0 + len(edges)] = np.minimum.reduceat(chunk, edges, axis=1)
+            maxs[:, b0:b0 + len(edges)] = np.maximum.reduceat(chunk, edges, axis=1)
+            self.built_samples = min(self.n_samples, start + self.chunk_samples)
+        levels = [(self.base_block, mins, maxs)]
+        while levels[-1][1].shape[1] > self.min_blocks:
+            block, lo, hi = levels[-1]
+            edges = np.arange(0, lo.shape[1], self.factor)
+            levels.append((block * self.factor,
+                           np.minimum.reduceat(lo, edges, axis=1),
+                           np.maximum.reduceat(hi, edges, axis=1)))
+        self.levels = levels
+        self.ready = True
+
+    def build_async(self):
+        def run():
+            t0 = time.perf_counter()
+            self.build()
+            print(f"[MinMaxPyramid] {time.strftime('%H:%M:%S')} Built {len(self.levels)} levels for {self.n_channels} channels x {self.n_samples} samples in {time.perf_counter() - t0:.2f} s")
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def envelope(self, ch_idx, i0, i1, n_pixels):
+        """(sample_positions, values) envelope of samples [i0, i1) of one channel, 2 * n_pixels long."""
+        i0 = max(0, int(i0))
+        i1 = min(self.n_samples, int(i1))
+        if i1 <= i0:
+            return np.array([]), np.array([])
+        samples_per_pixel = (i1 - i0) / max(1, n_pixels)
+        level = None
+        if self.ready:
+            for candidate in self.levels:
+                if candidate[0] <= samples_per_pixel:
+                    level = candidate
+        if level is None:
+            # Zoomed in below one block per pixel (or not built yet), reduce the raw samples
+            return minmax_envelope(np.asarray(self.signal[ch_idx, i0:i1]), n_pixels, i0)
+        block, mins, maxs = level
+        b0, b1 = i0 // block, -(-i1 // block)
+        lo, hi = mins[ch_idx, b0:b1], maxs[ch_idx, b0:b1]
+        n_bins = max(1, min(n_pixels, len(lo)))
+        edges = (np.arange(n_bins) * len(lo)) // n_bins
+        bin_start = (b0 + edges) * block
+        bin_end = np.minimum((b0 + np.append(edges[1:], len(lo))) * block, self.n_samples)
+        return _interleave(bin_start, bin_end, np.minimum.reduceat(lo, edges), np.maximum.reduceat(hi, edges))
+
+
+class StreamingMinMaxDecimator:
+    """Min/max envelope of the newest `window_samples` of a stream, one column per pixel.
+
+    Column k holds samples [k * samples_per_column, (k + 1) * samples_per_column) in
+    absolute sample numbers, so column borders stay put while the window scrolls. push()
+    folds a packet into its columns with one reduceat per block, envelope() returns the
+    last n_columns columns, so drawing costs 2 * n_columns vertices per channel whatever
+    the window length and no spike is lost.
+    """
+
+    def __init__(self, n_channels, window_samples, n_columns, dtype=np.float32):
+        self.n_channels = n_channels
+        self.n_columns = max(1, int(n_columns))
+        self.samples_per_column = max(1, -(-int(window_samples) // self.n_columns))
+        self.mins = np.zeros((n_channels, self.n_columns), dtype=dtype)
+        self.maxs = np.zeros((n_channels, self.n_columns), dtype=dtype)
+        # Sample offset of every envelope vertex from the start of the window
+        self.x = np.repeat((np.arange(self.n_columns) + 0.5) * self.samples_per_column, 2)
+        self.total = 0
+
+    @property
+    def window_samples(self):
+        return self.n_columns * self.samples_per_column
+
+    def reset(self):
+        self.mins[:] = 0
+        self.maxs[:] = 0
+        self.total = 0
+
+    def push(self, block: np.ndarray):
+        n = block.shape[1]
+        if n == 0:
+            return
+        spc = self.samples_per_column
+        columns = (self.total + np.arange(n)) // spc
+        edges = np.concatenate(([0], np.flatnonzero(np.diff(columns)) + 1))
+        lo = np.minimum.reduceat(block, edges, axis=1)
+        hi = np.maximum.reduceat(block, edges, axis=1)
+        slots = columns[edges] % self.n_columns
+        if self.total % spc:
+            # The first segment continues the column the previous packet started
+            lo[:, 0] = np.minimum(lo[:, 0], self.mins[:, slots[0]])
+            hi[:, 0] = np.maximum(hi[:, 0], self.maxs[:, slots[0]])
+        if len(slots) > self.n_columns:
+            slots, lo, hi = slots[-self.n_columns:], lo[:, -self.n_columns:], hi[:, -self.n_columns:]
+        self.mins[:, slots] = lo
+        self.maxs[:, slots] = hi
+        self.total += n
+
+    def envelope(self, out=None):
+        """(n_channels, 2 * n_columns) interleaved min/max, oldest column first.
+
+        Written into out when given, so a render loop can reuse one buffer.
+        """
+        current = (self.total - 1) // self.samples_per_column if self.total else -1
+        oldest = (current + 1) % self.n_columns
+        y = np.empty((self.n_channels, 2 * self.n_columns), dtype=self.mins.dtype) if out is None else out
+        # The columns are a ring, oldest..end followed by start..oldest, two slice copies each
+        split = 2 * (self.n_columns - oldest)
+        y[:, 0:split:2] = self.mins[:, oldest:]
+        y[:, 1:split:2] = self.maxs[:, oldest:]
+        y[:, split::2] = self.mins[:, :oldest]
+        y[:, split + 1::2] = self.maxs[:, :oldest]
+        return y
@@ -0,0 +1,167 @@
+import os
+import sys
+import asyncio
+import threading
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.EMGServer import EMGTCPServer
+from Service.BroadcastHub import DROP_OLDEST
+from Service.EMGProtocol import LENGTH_PREFIX, MAX_FRAME_SIZE, MSG_CONTROL, ProtocolError, decode_frame
+
+
+class AsyncEMGTCPServer(EMGTCPServer):
+    """EMGTCPServer engine that serves every client from one asyncio event loop.
+
+    Commands, pause/resume and the wire format are the same as the threaded engine.
+    The loop runs in a background thread so start()/stop() keep the same blocking-free
+    interface for the Qt side.
+    """
+
+    def __init__(self, host='localhost', port=12345, pkl_file=None, queue_size=64, overflow_policy=DROP_OLDEST, speed=1.0,
+                 source=None):
+        super().__init__(host=host, port=port, pkl_file=pkl_file, queue_size=queue_size,
+                         overflow_policy=overflow_policy, speed=speed, source=source)
+        self.loop = None
+        self.loop_thread = None
+        self.server = None
+        self.client_tasks = set()
+        self._stop_event = None
+        self._started = threading.Event()
+        self._start_error = None
+
+    def start(self):
+        self._started.clear()
+        self._start_error = None
+        self.loop_thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.loop_thread.start()
+        self._started.wait()
+        if self._start_error is not None:
+            self.connection_status.emit(False, f"Server start failed: {self._start_error}")
+            print(f"[Server] {time.strftime('%H:%M:%S')} Start failed: {self._start_error}")
+            raise self._start_error
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        finally:
+            self.loop.close()
+            self._started.set()
+
+    async def serve(self):
+        self._stop_event = asyncio.Event()
+        try:
+            self.server = await asyncio.start_server(self._handle_client, self.host, self.port, reuse_address=True)
+        except Exception as e:
+            self._start_error = e
+            self._started.set()
+            return
+        self.running = True
+        self.connection_status.emit(True, f"Server started on {self.host}:{self.port}")
+        print(f"[Server] {time.strftime('%H:%M:%S')} Started asyncio engine on {self.host}:{self.port}, Sampling rate: {self.sampling_rate} Hz, Replay speed: {self.scheduler.describe()}")
+        self._started.set()
+        producer = asyncio.create_task(self._produce())
+        await self._stop_event.wait()
+
+        # Shutdown: stop accepting, cancel every client task and wait for them to close their sockets.
+        # The client tasks go first: since Python 3.12.1 wait_closed() also waits for open
+        # connections, and their handlers would wait for a producer that no longer runs.
+        self.running = False
+        producer.cancel()
+        self.server.close()
+        for task in list(self.client_tasks):
+            task.cancel()
+        await asyncio.gather(*self.client_tasks, return_exceptions=True)
+        self.client_tasks.clear()
+        await self.server.wait_closed()
+
+    async def _handle_client(self, reader, writer):
+        address = writer.get_extra_info("peername")
+        task = asyncio.current_task()
+        self.client_tasks.add(task)
+        self.connection_status.emit(True, f"New connection from {address}")
+        print(f"[Server] {time.strftime('%H:%M:%S')} New connection from {address}, Total clients: {len(self.client_tasks)}")
+        session = self.new_session(address)
+        ready = asyncio.Event()
+        queue = self.hub.register(session, on_ready=ready.set)
+        self.hub.send_to(session, self.stream_info())
+        command_task = asyncio.create_task(self._read_commands(reader, session))
+        command_task.add_done_callback(lambda _: ready.set())
+        try:
+            await self._stream(writer, session, queue, ready, command_task)
+        except asyncio.CancelledError:
+            pass
+        except (ConnectionError, OSError) as e:
+            print(f"[Server] {time.strftime('%H:%M:%S')} Send error: {e}")
+        except Exception as e:
+            self.connection_status.emit(False, f"Client error: {e}")
+            print(f"[Server] {time.strftime('%H:%M:%S')} Client error: {e}")
+        finally:
+            self.hub.unregister(session)
+            command_task.cancel()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            self.client_tasks.discard(task)
+            self.connection_status.emit(False, "Client disconnected")
+            print(f"[Server] {time.strftime('%H:%M:%S')} Client disconnected, Sent: {session.packet_count}, Dropped: {queue.dropped}, Total clients: {len(self.client_tasks)}")
+
+    async def _read_commands(self, reader, session):
+        try:
+            while True:
+                (length,) = LENGTH_PREFIX.unpack(await reader.readexactly(LENGTH_PREFIX.size))
+                if length > MAX_FRAME_SIZE:
+                    raise ProtocolError(f"Invalid frame length {length}")
+                header, message = decode_frame(await reader.readexactly(length))
+                if header.msg_type != MSG_CONTROL:
+                    print(f"[Server] {time.strftime('%H:%M:%S')} Ignoring non-control frame from client")
+                    continue
+                self.handle_command(session, message.strip())
+        except asyncio.IncompleteReadError:
+            pass
+        except ProtocolError as e:
+            print(f"[Server] {time.strftime('%H:%M:%S')} Protocol error: {e}")
+
+    async def _produce(self):
+        self.scheduler.reset()
+        while self.running:
+            if self.paused:
+                await asyncio.sleep(0.1)
+                self.scheduler.reset()
+                continue
+            self.publish_next_frame()
+            await self.scheduler.wait_async()
+
+    async def _stream(self, writer, session, queue, ready, command_task):
+        # The producer only enqueues, a slow client backs up its own queue and never the loop
+        while self.running and not command_task.done():
+            await ready.wait()
+            ready.clear()
+            while (data_bytes := queue.get_nowait()) is not None:
+                writer.write(data_bytes)
+                session.packet_count += 1
+                await writer.drain()
+            if queue.closed:
+                print(f"[Server] {time.strftime('%H:%M:%S')} Send queue overflow, disconnecting {session.address}")
+                break
+
+    def stop(self):
+        if self.loop is not None and self._stop_event is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                pass
+        if self.loop_thread is not None:
+            self.loop_thread.join(timeout=5)
+            if self.loop_thread.is_alive():
+                self.running = False
+                self.connection_status.emit(False, "Server did not stop")
+                print(f"[Server] {time.strftime('%H:%M:%S')} Event loop did not stop within 5 s, {len(self.client_tasks)} client tasks left")
+                return
+            self.loop_thread = None
+        self.running = False
+        self.connection_status.emit(False, "Server stopped")
+        print(f"[Server] {time.strftime('%H:%M:%S')} Stopped")
@@ -1,7 +1,22 @@
+import os
+import sys
 import socket
 import numpy as np
 from PyQt5.QtCore import QObject, pyqtSignal, QThread
 import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.EMGProtocol import (
+    CHANNELS, SAMPLES_PER_PACKET, MSG_DATA, FrameReader,
+    mask_from_channels, format_mask, encode_control
+)
+from Service.Metrics import REGISTRY, RateLimitedLogger
+from Service.Tracing import TRACER
+from Service.Codecs import DEFAULT_ENCODING
+
+PACKETS_RECEIVED = REGISTRY.counter("emg_client_packets_total", "Data frames received")
+BYTES_RECEIVED = REGISTRY.counter("emg_client_bytes_total", "Bytes read from the socket")
+FRAMES_LOST = REGISTRY.counter("emg_client_lost_frames_total", "Frames missing from the sequence (server drops)")
+RECEIVE_BUFFER = REGISTRY.gauge("emg_client_receive_buffer_bytes", "Bytes received but not decoded yet")
 
 class TCPClientThread(QThread):
     def __init__(self, client, chunk_size):
@@ -10,33 +25,41 @@ class TCPClientThread(QThread):
         self.chunk_size = chunk_size
         self.running = False
         self.packet_count = 0
+        self.log = RateLimitedLogger("Client", interval=5.0)
 
     def run(self):
         self.running = True
+        reader = self.client.reader
         while self.running and self.client.running:
             if self.client.paused:
                 self.msleep(100)
                 continue
             try:
-                data = self.client.socket.recv(self.chunk_size)
-                if len(data) == self.chunk_size:
-                    array = np.frombuffer(data, dtype=np.float32).reshape(18)
-                    self.client.data_received.emit(array)
-                    self.packet_count += 1
-                    if self.packet_count % 500 == 0:
-                        min_val, max_val = np.min(array), np.max(array)
-                        print(f"[Client] {time.strftime('%H:%M:%S')} Received data packet {self.packet_count}, Shape: {array.shape}, Channel: Ch {self.client.current_channel}, Amplitude: [{min_val:.2f}, {max_val:.2f}], Bytes: {len(data)}")
-                elif len(data) == 0:
+                received = reader.recv_from(self.client.socket)
+                if received == 0:
                     self.running = False
                     self.client.connection_status.emit(False, "Server closed connection")
                     print(f"[Client] {time.strftime('%H:%M:%S')} Server closed connection")
                     self.client.reconnect()
                     break
-                else:
-                    print(f"[Client] {time.strftime('%H:%M:%S')} Incomplete data received: {len(data)} bytes")
+                BYTES_RECEIVED.inc(received)
+                lost = reader.lost_frames
+                for header, payload in reader.read_frames():
+                    if header.msg_type != MSG_DATA:
+                        self.client.handle_control(payload)
+                        continue
+                    TRACER.begin(header.seq, header.timestamp_ns)
+                    self.client.data_received.emit(payload, header)
+                    self.packet_count += 1
+                    PACKETS_RECEIVED.inc()
+                    self.log.log("packet", f"Received data packet {self.packet_count}, Seq: {header.seq}, Shape: {payload.shape}, Gaps: {reader.gaps}, Lost frames: {reader.lost_frames}")
+                FRAMES_LOST.inc(reader.lost_frames - lost)
+                RECEIVE_BUFFER.set(reader.write_pos - reader.read_pos)
             except socket.timeout:
                 continue
             except Exception as e:
+                if not (self.running and self.client.running):
+                    break
                 self.running = False
                 self.client.connection_status.emit(False, f"Receive error: {e}")
                 print(f"[Client] {time.strftime('%H:%M:%S')} Receive error: {e}")
@@ -48,8 +71,9 @@ class TCPClientThread(QThread):
         self.wait()
 
 class TCPClient(QObject):
-    data_received = pyqtSignal(np.ndarray)
+    data_received = pyqtSignal(np.ndarray, object)  # (len(channels), 18) frame, FrameHeader
     connection_status = pyqtSignal(bool, str)
+    stream_info = pyqtSignal(float, int)  # sampling rate and channel count announced by the server
 
     def __init__(self, host='localhost', port=12345, parent=None):
         super().__init__(parent)
@@ -59,8 +83,14 @@ class TCPClient(QObject):
         self.running = False
         self.paused = False
         self.current_channel = 0
-        self.chunk_size = 18 * 4  # 18 float32 = 72 bytes
+        self.channels = list(range(CHANNELS))  # subscribed channels, one frame carries all of them
+        self.subscribed = False  # until subscribe() is called, start streams every channel of the server
+        self.sampling_rate = None  # from the server's info frame, see handle_control
+        self.n_channels = CHANNELS
+        self.chunk_size = SAMPLES_PER_PACKET * 4  # 18 float32 = 72 bytes per channel
+        self.reader = FrameReader()
         self.thread = None
+        self.encoding = DEFAULT_ENCODING  # requested payload encoding, frames are decoded by their header either way
         self.connect()
 
     def connect(self):
@@ -72,8 +102,11 @@ class TCPClient(QObject):
                 self.socket.settimeout(5)
                 self.socket.connect((self.host, self.port))
                 self.running = True
+                self.reader = FrameReader()
                 self.connection_status.emit(True, f"Connected to {self.host}:{self.port}")
                 print(f"[Client] {time.strftime('%H:%M:%S')} Connected to {self.host}:{self.port}, Channel: Ch {self.current_channel}")
+                if self.encoding != DEFAULT_ENCODING:
+                    self.socket.sendall(encode_control(f"encoding:{self.encoding}"))
                 self.thread = TCPClientThread(self, self.chunk_size)
                 self.thread.start()
                 return
@@ -105,11 +138,15 @@ class TCPClient(QObject):
 
     def start(self, channel: int):
         self.current_channel = channel
+        if channel not in self.channels:
+            self.channels = sorted(self.channels + [channel])
         self.paused = False
         if self.running and self.socket:
             try:
-                self.socket.send(f"start:channel:{channel}".encode())
-                print(f"[Client] {time.strftime('%H:%M:%S')} Sent start:channel:{channel}")
+                message = f"start:mask:{format_mask(mask_from_channels(self.channels))}"
+                self.reader.reset_sequence()
+                self.socket.sendall(encode_control(message))
+                print(f"[Client] {time.strftime('%H:%M:%S')} Sent {message}")
             except Exception as e:
                 self.connection_status.emit(False, f"Failed to send start: {e}")
                 print(f"[Client] {time.strftime('%H:%M:%S')} Failed to send start: {e}")
@@ -124,7 +161,9 @@ class TCPClient(QObject):
         if self.running and self.socket:
             try:
                 message = "pause" if self.paused else "resume"
-                self.socket.send(message.encode())
+                # The stream is shared, frames skipped while paused are not lost frames
+                self.reader.reset_sequence()
+                self.socket.sendall(encode_control(message))
                 self.connection_status.emit(not self.paused, "Paused" if self.paused else "Resumed")
                 print(f"[Client] {time.strftime('%H:%M:%S')} Sent {message}, Channel: Ch {self.current_channel}")
             except Exception as e:
@@ -136,17 +175,63 @@ class TCPClient(QObject):
             print(f"[Client] {time.strftime('%H:%M:%S')} Not connected, cannot pause/resume")
             self.reconnect()
 
-    def send_channel(self, channel: int):
-        self.current_channel = channel
+    def subscribe(self, channels):
+        self.channels = sorted(set(int(ch) for ch in channels))
+        self.subscribed = True
         if self.running and self.socket:
             try:
-                self.socket.send(f"switch:channel:{channel}".encode())
-                print(f"[Client] {time.strftime('%H:%M:%S')} Sent switch:channel:{channel}")
+                message = f"subscribe:mask:{format_mask(mask_from_channels(self.channels))}"
+                self.socket.sendall(encode_control(message))
+                print(f"[Client] {time.strftime('%H:%M:%S')} Sent {message}")
             except Exception as e:
-                self.connection_status.emit(False, f"Failed to send channel: {e}")
-                print(f"[Client] {time.strftime('%H:%M:%S')} Failed to send channel: {e}")
+                self.connection_status.emit(False, f"Failed to send subscription: {e}")
+                print(f"[Client] {time.strftime('%H:%M:%S')} Failed to send subscription: {e}")
                 self.reconnect()
         else:
-            self.connection_status.emit(False, "Not connected, cannot switch channel")
-            print(f"[Client] {time.strftime('%H:%M:%S')} Not connected, cannot switch channel")
-            self.reconnect()
\ No newline at end of file
+            self.connection_status.emit(False, "Not connected, cannot subscribe")
+            print(f"[Client] {time.strftime('%H:%M:%S')} Not connected, cannot subscribe")
+            self.reconnect()
+
+    def set_encoding(self, name: str):
+        # Takes effect once the server acknowledges it, see handle_control
+        self.encoding = name
+        if self.running and self.socket:
+            try:
+                self.socket.sendall(encode_control(f"encoding:{name}"))
+                print(f"[Client] {time.strftime('%H:%M:%S')} Requested encoding {name}")
+            except Exception as e:
+                self.connection_status.emit(False, f"Failed to send encoding: {e}")
+                print(f"[Client] {time.strftime('%H:%M:%S')} Failed to send encoding: {e}")
+
+    def handle_control(self, message: str):
+        # Client thread
+        if message.startswith("info:"):
+            fields = dict(item.split("=", 1) for item in message[len("info:"):].split(",") if "=" in item)
+            try:
+                sampling_rate, n_channels = float(fields["sampling_rate"]), int(fields["channels"])
+            except (KeyError, ValueError):
+                print(f"[Client] {time.strftime('%H:%M:%S')} Invalid stream info from server: {message}")
+                return
+            self.sampling_rate, self.n_channels = sampling_rate, n_channels
+            if self.subscribed:
+                self.channels = [ch for ch in self.channels if ch < n_channels] or [0]
+            else:
+                self.channels = list(range(n_channels))
+            self.stream_info.emit(sampling_rate, n_channels)
+            print(f"[Client] {time.strftime('%H:%M:%S')} Stream: {n_channels} channels at {sampling_rate:g} Hz")
+        elif message.startswith("encoding:ok:"):
+            print(f"[Client] {time.strftime('%H:%M:%S')} Server switched to encoding {message[len('encoding:ok:'):]}")
+        elif message.startswith("encoding:error:"):
+            self.encoding = DEFAULT_ENCODING
+            self.connection_status.emit(False, f"Encoding refused: {message[len('encoding:error:'):]}")
+            print(f"[Client] {time.strftime('%H:%M:%S')} Encoding refused, staying on {DEFAULT_ENCODING}: {message}")
+        else:
+            print(f"[Client] {time.strftime('%H:%M:%S')} Control message from server: {message}")
+
+    def send_channel(self, channel: int):
+        # Subscribed channels are already in every frame, switching is local
+        self.current_channel = channel
+        if channel in self.channels:
+            print(f"[Client] {time.strftime('%H:%M:%S')} Switched to subscribed channel: Ch {channel}")
+            return
+        self.subscribe(self.channels + [channel])
@@ -0,0 +1,194 @@
+import struct
+from collections import namedtuple
+import numpy as np
+from Service.Codecs import ENCODING_FLOAT32, CodecError, codec_for_id
+
+CHANNELS = 32
+SAMPLES_PER_PACKET = 18
+ALL_CHANNELS_MASK = (1 << CHANNELS) - 1
+
+# Wire format, every message (data and control, both directions) is one frame:
+#   uint32 length of the rest of the frame
+#   header (HEADER below)
+#   channel mask, mask_len bytes, little-endian bit i = channel i
+#   payload, n_channels x n_samples float32 for data frames (or the header's encoding,
+#            see Codecs.py), utf-8 text for control frames
+MAGIC = b"EM"
+VERSION = 1
+MSG_DATA = 1
+MSG_CONTROL = 2
+
+LENGTH_PREFIX = struct.Struct('<I')
+# magic, version, msg_type, encoding, n_channels, n_samples, mask_len, seq, timestamp_ns
+HEADER = struct.Struct('<2sBBBxHHHIq')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+SEQ_MODULO = 1 << 32
+
+FrameHeader = namedtuple("FrameHeader", ["msg_type", "encoding", "n_channels", "n_samples", "seq", "timestamp_ns", "channels"])
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def mask_from_channels(channels):
+    mask = 0
+    for ch in channels:
+        mask |= 1 << int(ch)
+    return mask
+
+
+def channels_from_mask(mask: int):
+    channels = []
+    ch = 0
+    while mask:
+        if mask & 1:
+            channels.append(ch)
+        mask >>= 1
+        ch += 1
+    return channels
+
+
+def parse_mask(text: str):
+    text = text.strip().lower()
+    if text == "all":
+        return ALL_CHANNELS_MASK
+    return int(text, 16)
+
+
+def format_mask(mask: int):
+    return f"{mask:x}"
+
+
+def _mask_bytes(mask: int):
+    return int(mask).to_bytes((int(mask).bit_length() + 7) // 8, "little")
+
+
+def encode_frame(mask: int, frame: np.ndarray, seq: int, timestamp_ns: int, codec=None):
+    # frame: (len(channels), n_samples), rows ordered by channel index; codec: Codecs.Codec, None for float32
+    mask_bytes = _mask_bytes(mask)
+    if codec is None:
+        encoding, payload = ENCODING_FLOAT32, frame.astype(np.float32, copy=False).tobytes(order='C')
+    else:
+        encoding, payload = codec.id, codec.encode(frame)
+    header = HEADER.pack(MAGIC, VERSION, MSG_DATA, encoding, frame.shape[0], frame.shape[1],
+                         len(mask_bytes), seq % SEQ_MODULO, timestamp_ns)
+    return LENGTH_PREFIX.pack(len(header) + len(mask_bytes) + len(payload)) + header + mask_bytes + payload
+
+
+def encode_control(message: str, seq: int = 0, timestamp_ns: int = 0):
+    payload = message.encode()
+    header = HEADER.pack(MAGIC, VERSION, MSG_CONTROL, ENCODING_FLOAT32, 0, 0, 0, seq % SEQ_MODULO, timestamp_ns)
+    return LENGTH_PREFIX.pack(len(header) + len(payload)) + header + payload
+
+
+def decode_frame(buffer, start=0, end=None, resolve_channels=None):
+    """Decodes one frame body (everything after the length prefix) from buffer[start:end]."""
+    end = len(buffer) if end is None else end
+    if end - start < HEADER.size:
+        raise ProtocolError(f"Frame too short: {end - start} bytes")
+    magic, version, msg_type, encoding, n_channels, n_samples, mask_len, seq, timestamp_ns = \
+        HEADER.unpack_from(buffer, start)
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError(f"Invalid frame header: magic={magic!r}, version={version}")
+    mask_start = start + HEADER.size
+    payload_start = mask_start + mask_len
+    mask_bytes = bytes(buffer[mask_start:payload_start])
+    if resolve_channels is not None:
+        channels = resolve_channels(mask_bytes)
+    else:
+        channels = channels_from_mask(int.from_bytes(mask_bytes, "little"))
+    if msg_type == MSG_DATA and encoding != ENCODING_FLOAT32:
+        if len(channels) != n_channels:
+            raise ProtocolError(f"Data frame mask has {len(channels)} channels, header {n_channels}")
+        try:
+            payload = codec_for_id(encoding).decode(memoryview(buffer)[payload_start:end], n_channels, n_samples)
+        except CodecError as e:
+            raise ProtocolError(str(e)) from e
+    elif msg_type == MSG_DATA:
+        if len(channels) != n_channels or (end - payload_start) != n_channels * n_samples * 4:
+            raise ProtocolError(f"Data frame size mismatch: {n_channels} channels x {n_samples} samples, {end - payload_start} bytes")
+        payload = np.frombuffer(buffer, dtype=np.float32, count=n_channels * n_samples,
+                                offset=payload_start).reshape(n_channels, n_samples).copy()
+    else:
+        payload = bytes(buffer[payload_start:end]).decode()
+    return FrameHeader(msg_type, encoding, n_channels, n_samples, seq, timestamp_ns, channels), payload
+
+
+class FrameReader:
+    """Reassembles frames from a byte stream into one preallocated buffer.
+
+    recv_from() reads whatever the socket has with recv_into, read_frames() yields every
+    complete frame as (FrameHeader, payload). Data payloads are decoded to a
+    (n_channels, n_samples) float32 array, control payloads to a string.
+    """
+
+    def __init__(self, capacity=256 * 1024):
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.read_pos = 0
+        self.write_pos = 0
+        self.expected_seq = None
+        self.frames = 0
+        self.gaps = 0
+        self.lost_frames = 0
+        self._mask_cache = (b"", [])
+
+    def recv_from(self, sock):
+        if self.write_pos == len(self.buffer):
+            self._make_room()
+        n = sock.recv_into(self.view[self.write_pos:])
+        self.write_pos += n
+        return n
+
+    def _make_room(self, needed=0):
+        pending = self.write_pos - self.read_pos
+        if self.read_pos > 0:
+            self.buffer[:pending] = self.buffer[self.read_pos:self.write_pos]
+            self.read_pos = 0
+            self.write_pos = pending
+        if pending + needed >= len(self.buffer) or self.write_pos == len(self.buffer):
+            # A single frame is larger than the buffer, grow it once
+            self.view.release()
+            self.buffer.extend(bytearray(max(len(self.buffer), needed)))
+            self.view = memoryview(self.buffer)
+
+    def _channels(self, mask_bytes):
+        if mask_bytes != self._mask_cache[0]:
+            self._mask_cache = (mask_bytes, channels_from_mask(int.from_bytes(mask_bytes, "little")))
+        return self._mask_cache[1]
+
+    def reset_sequence(self):
+        # Called after pause/resubscribe, the next frame starts a new run
+        self.expected_seq = None
+
+    def read_frames(self):
+        while True:
+            available = self.write_pos - self.read_pos
+            if available < LENGTH_PREFIX.size:
+                break
+            (length,) = LENGTH_PREFIX.unpack_from(self.buffer, self.read_pos)
+            if length < HEADER.size or length > MAX_FRAME_SIZE:
+                raise ProtocolError(f"Invalid frame length {length}")
+            if available < LENGTH_PREFIX.size + length:
+                if LENGTH_PREFIX.size + length > len(self.buffer) - self.read_pos:
+                    self._make_room(LENGTH_PREFIX.size + length)
+                break
+            start = self.read_pos + LENGTH_PREFIX.size
+            end = start + length
+            header, payload = decode_frame(self.buffer, start, end, self._channels)
+            if header.msg_type == MSG_DATA:
+                self._track_sequence(header.seq)
+            self.read_pos = end
+            yield header, payload
+        if self.read_pos == self.write_pos:
+            self.read_pos = self.write_pos = 0
+
+    def _track_sequence(self, seq):
+        self.frames += 1
+        if self.expected_seq is not None and seq != self.expected_seq:
+            missing = (seq - self.expected_seq) % SEQ_MODULO
+            if missing < SEQ_MODULO // 2:
+                self.gaps += 1
+                self.lost_frames += missing
+        self.expected_seq = (seq + 1) % SEQ_MODULO
@@ -1,9 +1,50 @@
-import pickle
+import os
+import sys
 import socket
 import threading
 import time
 import numpy as np
 from PyQt5.QtCore import QObject, pyqtSignal
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.EMGProtocol import (
+    SAMPLES_PER_PACKET, MSG_CONTROL, FrameReader, ProtocolError,
+    channels_from_mask, mask_from_channels, parse_mask, encode_control
+)
+from Service.BroadcastHub import BroadcastHub, DROP_OLDEST, OVERFLOW_POLICIES, CLIENTS, FRAMES_DROPPED
+from Service.Metrics import REGISTRY, RateLimitedLogger, start_metrics_server
+from Service.Pacing import PacingScheduler, parse_speed
+from Service.DataSources import RecordingSource, SyntheticEMGSource
+from Service.Codecs import DEFAULT_ENCODING, CodecError, get_codec
+
+
+FRAMES_PUBLISHED = REGISTRY.counter("emg_server_frames_total", "Frames produced by the replay loop")
+
+
+class ClientSession:
+    """Per-client stream state, shared by the threaded and the asyncio server engine."""
+
+    def __init__(self, mask, address=None):
+        # Every client streams all channels until it asks otherwise
+        self.subscribe(mask)
+        self.paused = False
+        self.address = address
+        self.queue = None  # ClientQueue, set by BroadcastHub.register
+        self.packet_count = 0
+        self.encoding = DEFAULT_ENCODING
+        self.codec = None  # Codecs.Codec of a negotiated encoding, None sends plain float32
+
+    def subscribe(self, mask):
+        # (mask, channels) is replaced in one assignment, the producer thread reads it once
+        # per frame and never sees a mask with the channels of the previous subscription
+        self.subscription = (mask, channels_from_mask(mask))  # never mutated in place
+
+    @property
+    def mask(self):
+        return self.subscription[0]
+
+    @property
+    def channels(self):
+        return self.subscription[1]
 
 
 class EMGTCPServer(QObject):
@@ -11,41 +52,42 @@ class EMGTCPServer(QObject):
     connection_status = pyqtSignal(bool, str)
     pause_status = pyqtSignal(bool, str)
 
-    def __init__(self, host='localhost', port=12345, pkl_file=None):
+    def __init__(self, host='localhost', port=12345, pkl_file=None, queue_size=64, overflow_policy=DROP_OLDEST, speed=1.0,
+                 source=None):
         super().__init__()
         self.host = host
         self.port = port
         if pkl_file is None:
-            import os
             BASE_DIR = os.path.dirname(os.path.abspath(__file__))
             pkl_file = os.path.join(BASE_DIR, '..', 'others', 'recording.pkl')
             pkl_file = os.path.normpath(pkl_file)
         self.pkl_file = pkl_file
+        self.source = source  # DataSource, replays pkl_file when not given
         self.server_socket = None
-        self.clients = []
+        self.clients = {}  # client socket -> its handler thread
         self.client_lock = threading.Lock()
         self.running = False
         self.paused = False
-        self.data = None
         self.sampling_rate = None
-        self.current_channel = 0
-        self.CHANNELS = 32
-        self.SAMPLES_PER_PACKET = 18
+        self.n_channels = 0
+        self.SAMPLES_PER_PACKET = SAMPLES_PER_PACKET
+        # One producer reads and serializes each window once, clients drain their own bounded queue
+        self.hub = BroadcastHub(queue_size=queue_size, policy=overflow_policy)
+        self.window_index = 0
+        self.frame_count = 0
+        self.log = RateLimitedLogger("Server", interval=5.0)
         self.load_data()
+        self.scheduler = PacingScheduler(self.sampling_rate, self.SAMPLES_PER_PACKET, speed)
 
     def load_data(self):
         try:
-            with open(self.pkl_file, 'rb') as f:
-                self.data = pickle.load(f)
-            self.emg_signal = self.data['biosignal'][:32, :, :]
-            self.sampling_rate = self.data['device_information']['sampling_frequency']
-            if not isinstance(self.sampling_rate, (int, float)) or self.sampling_rate <= 0:
-                raise ValueError("Invalid sampling rate")
-            for ch in range(min(5, self.CHANNELS)):
-                min_val, max_val = np.min(self.emg_signal[ch, :, :]), np.max(self.emg_signal[ch, :, :])
-                print(f"[Server] {time.strftime('%H:%M:%S')} Channel {ch} data: Amplitude [{min_val:.2f}, {max_val:.2f}]")
-            self.connection_status.emit(True, f"Data loaded successfully. Shape: {self.emg_signal.shape}, Sampling rate: {self.sampling_rate} Hz")
-            print(f"[Server] {time.strftime('%H:%M:%S')} Data loaded: Shape={self.emg_signal.shape}, Sampling rate={self.sampling_rate} Hz")
+            if self.source is None:
+                # Converted recordings are memory-mapped, only the windows actually sent are read
+                self.source = RecordingSource(self.pkl_file, self.SAMPLES_PER_PACKET)
+            self.sampling_rate = self.source.sampling_rate
+            self.n_channels = self.source.n_channels
+            self.connection_status.emit(True, f"Data loaded successfully. {self.source.describe()}, Sampling rate: {self.sampling_rate} Hz")
+            print(f"[Server] {time.strftime('%H:%M:%S')} Data loaded from {self.source.describe()}, Sampling rate={self.sampling_rate} Hz")
         except Exception as e:
             self.connection_status.emit(False, f"Error loading data: {e}")
             print(f"[Server] {time.strftime('%H:%M:%S')} Error loading data: {e}")
@@ -56,13 +98,16 @@ class EMGTCPServer(QObject):
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            self.server_socket.listen(128)
             self.running = True
             self.connection_status.emit(True, f"Server started on {self.host}:{self.port}")
-            print(f"[Server] {time.strftime('%H:%M:%S')} Started on {self.host}:{self.port}, Sampling rate: {self.sampling_rate} Hz")
+            print(f"[Server] {time.strftime('%H:%M:%S')} Started on {self.host}:{self.port}, Sampling rate: {self.sampling_rate} Hz, Replay speed: {self.scheduler.describe()}")
             accept_thread = threading.Thread(target=self.accept_connections)
             accept_thread.daemon = True
             accept_thread.start()
+            producer_thread = threading.Thread(target=self.produce_frames)
+            producer_thread.daemon = True
+            producer_thread.start()
         except Exception as e:
             self.connection_status.emit(False, f"Server start failed: {e}")
             print(f"[Server] {time.strftime('%H:%M:%S')} Start failed: {e}")
@@ -73,12 +118,12 @@ class EMGTCPServer(QObject):
             try:
                 self.server_socket.settimeout(1.0)
                 client_socket, address = self.server_socket.accept()
+                client_thread = threading.Thread(target=self.handle_client, args=(client_socket, address))
+                client_thread.daemon = True
                 with self.client_lock:
-                    self.clients.append(client_socket)
+                    self.clients[client_socket] = client_thread
                 self.connection_status.emit(True, f"New connection from {address}")
                 print(f"[Server] {time.strftime('%H:%M:%S')} New connection from {address}, Total clients: {len(self.clients)}")
-                client_thread = threading.Thread(target=self.handle_client, args=(client_socket,))
-                client_thread.daemon = True
                 client_thread.start()
             except socket.timeout:
                 continue
@@ -87,95 +132,216 @@ class EMGTCPServer(QObject):
                     self.connection_status.emit(False, f"Error accepting connection: {e}")
                     print(f"[Server] {time.strftime('%H:%M:%S')} Error accepting connection: {e}")
 
-    def handle_client(self, client_socket):
-        try:
-            num_windows = self.emg_signal.shape[2]
-            window_index = 0
-            packet_count = 0
-            while self.running:
-                try:
-                    client_socket.settimeout(0.1)
-                    data = client_socket.recv(1024)
-                    if data:
-                        message = data.decode().strip()
-                        if message.startswith("start:channel:"):
-                            self.current_channel = int(message.split(":")[2])
-                            self.paused = False
-                            window_index = 0
-                            packet_count = 0
-                            print(f"[Server] {time.strftime('%H:%M:%S')} Started sending data for Ch {self.current_channel}, Window: {window_index}/{num_windows}"
-                                  f"Started streaming Ch {self.current_channel}")
-                        elif message.startswith("switch:channel:"):
-                            self.current_channel = int(message.split(":")[2])
-                            window_index = 0
-                            packet_count = 0
-                            print(f"[Server] {time.strftime('%H:%M:%S')} Switched to channel: Ch {self.current_channel}, Window: {window_index}/{num_windows}")
-                        elif message == "pause":
-                            self.paused = True
-                            self.pause_status.emit(True, "Paused")
-                            print(f"[Server] {time.strftime('%H:%M:%S')} Paused, Channel: Ch {self.current_channel}, Window: {window_index}/{num_windows}")
-                        elif message == "resume":
-                            self.paused = False
-                            self.pause_status.emit(False, "Resumed")
-                            print(f"[Server] {time.strftime('%H:%M:%S')} Resumed, Channel: Ch {self.current_channel}, Window: {window_index}/{num_windows}")
-                        else:
-                            print(f"[Server] {time.strftime('%H:%M:%S')} Invalid message: {message}")
-                except socket.timeout:
-                    pass
+    def produce_frames(self):
+        self.scheduler.reset()
+        while self.running:
+            if self.paused:
+                time.sleep(0.1)
+                self.scheduler.reset()
+                continue
+            self.publish_next_frame()
+            self.scheduler.wait()
 
-                if self.paused or window_index >= num_windows:
-                    time.sleep(0.1)
-                    continue
+    def publish_next_frame(self):
+        num_windows = self.source.n_windows
+        # Every channel of the window, read once for all clients
+        current_frame = self.source.window(self.window_index)
+        delivered = self.hub.publish(current_frame, time.time_ns())
+        self.data_received.emit(current_frame)
+        self.frame_count += 1
+        FRAMES_PUBLISHED.inc()
+        self.log.log("publish", f"Published frame {self.frame_count}, Window {self.window_index}/{num_windows}, Clients: {delivered}/{int(CLIENTS.value)}, Dropped: {FRAMES_DROPPED.value}, Rate: {self.scheduler.effective_rate():.0f} Hz ({self.scheduler.describe()})")
+        self.window_index += 1
+        if self.window_index >= num_windows:
+            self.window_index = 0
+            print(f"[Server] {time.strftime('%H:%M:%S')} Restarted data transmission, Window: {self.window_index}/{num_windows}")
+        return current_frame
 
-                current_window = self.emg_signal[self.current_channel, :, window_index]
-                data_bytes = current_window.astype(np.float32).tobytes(order='C')
+    def handle_client(self, client_socket, address=None):
+        # Sender: blocks on the client's queue, which is closed to wake it up when the client
+        # goes away, the server stops or the queue overflows under the disconnect policy
+        session = self.new_session(address)
+        queue = self.hub.register(session)
+        self.hub.send_to(session, self.stream_info())
+        client_socket.settimeout(None)
+        reader_thread = threading.Thread(target=self.read_commands, args=(client_socket, session), daemon=True)
+        reader_thread.start()
+        try:
+            while True:
+                data_bytes = queue.get()
+                if data_bytes is None:
+                    if self.running and reader_thread.is_alive():
+                        print(f"[Server] {time.strftime('%H:%M:%S')} Send queue overflow, disconnecting {address}")
+                    break
                 try:
                     client_socket.sendall(data_bytes)
-                    self.data_received.emit(current_window[np.newaxis, :])
-                    packet_count += 1
-                    if packet_count % 100 == 0:
-                        min_val, max_val = np.min(current_window), np.max(current_window)
-                        print(f"[Server] {time.strftime('%H:%M:%S')} Sent packet {packet_count}, Window {window_index}/{num_windows}, Channel: Ch {self.current_channel}, Amplitude: [{min_val:.2f}, {max_val:.2f}], Bytes: {len(data_bytes)}")
-                except Exception as e:
-                    print(f"[Server] {time.strftime('%H:%M:%S')} Send error: {e}")
+                    session.packet_count += 1
+                except OSError as e:
+                    if self.running:
+                        print(f"[Server] {time.strftime('%H:%M:%S')} Send error: {e}")
                     break
-
-                sleep_time = self.SAMPLES_PER_PACKET / self.sampling_rate
-                time.sleep(sleep_time)
-                window_index += 1
-
-                if window_index >= num_windows:
-                    window_index = 0
-                    print(f"[Server] {time.strftime('%H:%M:%S')} Restarted data transmission, Channel: Ch {self.current_channel}, Window: {window_index}/{num_windows}")
         except Exception as e:
             self.connection_status.emit(False, f"Client error: {e}")
             print(f"[Server] {time.strftime('%H:%M:%S')} Client error: {e}")
         finally:
-            with self.client_lock:
-                if client_socket in self.clients:
-                    self.clients.remove(client_socket)
+            self.hub.unregister(session)
+            try:
+                # Wakes the command reader blocked in recv before the socket is closed under it
+                client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            reader_thread.join()
             client_socket.close()
+            with self.client_lock:
+                self.clients.pop(client_socket, None)
             self.connection_status.emit(False, "Client disconnected")
-            print(f"[Server] {time.strftime('%H:%M:%S')} Client disconnected, Total clients: {len(self.clients)}")
+            print(f"[Server] {time.strftime('%H:%M:%S')} Client disconnected, Sent: {session.packet_count}, Dropped: {queue.dropped}, Total clients: {len(self.clients)}")
+
+    def read_commands(self, client_socket, session):
+        # Blocks in recv, commands are handled as they arrive and replies go through the queue
+        reader = FrameReader(capacity=4096)
+        try:
+            while reader.recv_from(client_socket) != 0:
+                for header, message in reader.read_frames():
+                    if header.msg_type != MSG_CONTROL:
+                        print(f"[Server] {time.strftime('%H:%M:%S')} Ignoring non-control frame from client")
+                        continue
+                    self.handle_command(session, message.strip())
+        except ProtocolError as e:
+            print(f"[Server] {time.strftime('%H:%M:%S')} Protocol error: {e}")
+        except OSError:
+            pass  # connection reset, or shut down by the sender
+        finally:
+            session.queue.close()  # the sender wakes up and ends the connection
+
+    def new_session(self, address=None):
+        return ClientSession((1 << self.n_channels) - 1, address)
+
+    def stream_info(self):
+        # First frame of every connection, clients size their filters, time axes and channel lists from it
+        return encode_control(f"info:sampling_rate={self.sampling_rate:g},channels={self.n_channels}")
+
+    def handle_command(self, session, message: str):
+        num_windows = self.source.n_windows
+        try:
+            if message.startswith("start:channel:") or message.startswith("start:mask:"):
+                # The stream is shared, start joins it at the current window
+                session.subscribe(self._parse_subscription(message))
+                session.paused = False
+                print(f"[Server] {time.strftime('%H:%M:%S')} Started streaming channels {session.channels}, Window: {self.window_index}/{num_windows}")
+            elif message.startswith("switch:channel:") or message.startswith("subscribe:mask:"):
+                session.subscribe(self._parse_subscription(message))
+                print(f"[Server] {time.strftime('%H:%M:%S')} Subscription changed to channels {session.channels}, Window: {self.window_index}/{num_windows}")
+            elif message == "pause":
+                session.paused = True
+                self.pause_status.emit(True, "Paused")
+                print(f"[Server] {time.strftime('%H:%M:%S')} Paused, Channels: {session.channels}, Window: {self.window_index}/{num_windows}")
+            elif message == "resume":
+                session.paused = False
+                self.pause_status.emit(False, "Resumed")
+                print(f"[Server] {time.strftime('%H:%M:%S')} Resumed, Channels: {session.channels}, Window: {self.window_index}/{num_windows}")
+            elif message.startswith("encoding:"):
+                # Acknowledged before the first frame in the new encoding, the client decodes either way
+                name = message.split(":", 1)[1].strip()
+                try:
+                    codec = None if name == DEFAULT_ENCODING else get_codec(name)
+                except CodecError as e:
+                    self.hub.send_to(session, encode_control(f"encoding:error:{e}"))
+                    print(f"[Server] {time.strftime('%H:%M:%S')} Refused encoding '{name}': {e}")
+                    return
+                self.hub.send_to(session, encode_control(f"encoding:ok:{name}"))
+                session.codec = codec
+                session.encoding = name
+                print(f"[Server] {time.strftime('%H:%M:%S')} Encoding changed to {name} for {session.address}")
+            elif message == "stats":
+                queue = session.queue
+                self.hub.send_to(session, encode_control(f"stats:depth={queue.depth()},max_depth={queue.max_depth},enqueued={queue.enqueued},dropped={queue.dropped}"))
+            else:
+                print(f"[Server] {time.strftime('%H:%M:%S')} Invalid message: {message}")
+        except ValueError as e:
+            print(f"[Server] {time.strftime('%H:%M:%S')} Invalid subscription: {e}")
+
+    def client_stats(self):
+        return self.hub.client_stats()
+
+    def _parse_subscription(self, message: str):
+        # "start:channel:N" / "switch:channel:N" subscribe to a single channel,
+        # "start:mask:<hex>" / "subscribe:mask:<hex>" to any subset ("all" for every channel)
+        kind, value = message.split(":")[1:3]
+        if kind == "channel":
+            mask = mask_from_channels([int(value)])
+        elif value.strip().lower() == "all":
+            mask = (1 << self.n_channels) - 1
+        else:
+            mask = parse_mask(value)
+        mask &= (1 << self.n_channels) - 1
+        if mask == 0:
+            raise ValueError(f"empty channel mask in '{message}'")
+        return mask
 
     def toggle_pause(self):
         self.paused = not self.paused
         self.connection_status.emit(not self.paused, "Paused" if self.paused else "Resumed")
-        print(f"[Server] {time.strftime('%H:%M:%S')} State changed: {'Paused' if self.paused else 'Resumed'}, Channel: Ch {self.current_channel}")
+        print(f"[Server] {time.strftime('%H:%M:%S')} State changed: {'Paused' if self.paused else 'Resumed'}")
 
     def stop(self):
         self.running = False
         if self.server_socket:
+            try:
+                # Wakes the accept thread, a plain close() leaves the port listening until accept() times out
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
             self.server_socket.close()
+        # Closing the queues wakes every sender, each one closes its own socket and exits
         with self.client_lock:
-            for client in self.clients:
-                client.close()
-            self.clients.clear()
+            handlers = dict(self.clients)
+        self.hub.close_all()
+        for client, thread in handlers.items():
+            thread.join(2.0)
+            if thread.is_alive():
+                # Stuck in sendall to a client that stopped reading
+                try:
+                    client.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                thread.join(2.0)
         self.connection_status.emit(False, "Server stopped")
-        print(f"[Server] {time.strftime('%H:%M:%S')} Stopped, Channel: Ch {self.current_channel}")
+        print(f"[Server] {time.strftime('%H:%M:%S')} Stopped")
 
 if __name__ == "__main__":
-    server = EMGTCPServer()
+    import argparse
+    parser = argparse.ArgumentParser(description="EMG streaming server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--file", default=None, help="recording to replay, defaults to others/recording.pkl")
+    parser.add_argument("--engine", choices=("threaded", "asyncio"), default="threaded",
+                        help="threaded: one thread per client, asyncio: all clients on one event loop")
+    parser.add_argument("--queue-size", type=int, default=64, help="packets buffered per client")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES, default=DROP_OLDEST,
+                        help="what to do when a client's queue is full")
+    parser.add_argument("--speed", type=parse_speed, default=1.0,
+                        help="replay speed: 1 for real time, N for N times faster, 'max' for unpaced")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--synthetic", action="store_true", help="stream seeded synthetic EMG instead of a recording")
+    parser.add_argument("--channels", type=int, default=256, help="synthetic channel count")
+    parser.add_argument("--fs", type=float, default=10000, help="synthetic sampling rate in Hz")
+    parser.add_argument("--duration", type=float, default=60.0, help="synthetic signal length in seconds before it repeats")
+    parser.add_argument("--seed", type=int, default=0, help="synthetic signal seed")
+    args = parser.parse_args()
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port)
+    source = None
+    if args.synthetic:
+        source = SyntheticEMGSource(args.channels, args.fs, args.duration, args.seed)
+    options = dict(host=args.host, port=args.port, pkl_file=args.file, queue_size=args.queue_size,
+                   overflow_policy=args.overflow, speed=args.speed, source=source)
+    if args.engine == "asyncio":
+        from Service.EMGAsyncServer import AsyncEMGTCPServer
+        server = AsyncEMGTCPServer(**options)
+    else:
+        server = EMGTCPServer(**options)
     try:
         server.start()
         while True:
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+MAX_THROUGHPUT = 0  # speed value for unpaced replay
+
+
+def parse_speed(text):
+    # "1", "4", "0.5" or "max"
+    if str(text).strip().lower() in ("max", "0", "unpaced"):
+        return MAX_THROUGHPUT
+    speed = float(text)
+    if speed <= 0:
+        raise ValueError(f"Replay speed must be positive or 'max', got {text}")
+    return speed
+
+
+class PacingScheduler:
+    """Deadline-based packet clock on time.monotonic.
+
+    Packet n is due at start + n * interval, so time spent sending or logging does not
+    add up over long runs, the average rate stays at sampling_rate * speed. speed > 1
+    replays faster than real time, MAX_THROUGHPUT does not wait at all. If the producer
+    falls more than max_lag seconds behind, the clock is re-anchored instead of
+    bursting to catch up.
+    """
+
+    def __init__(self, sampling_rate, samples_per_packet, speed=1.0, max_lag=0.5):
+        self.sampling_rate = sampling_rate
+        self.samples_per_packet = samples_per_packet
+        self.max_lag = max_lag
+        self.resyncs = 0
+        self.set_speed(speed)
+
+    def set_speed(self, speed):
+        self.speed = speed
+        self.interval = 0.0 if speed == MAX_THROUGHPUT else self.samples_per_packet / (self.sampling_rate * speed)
+        self.reset()
+
+    def reset(self):
+        self.start = time.monotonic()
+        self.packets = 0
+
+    def _next_delay(self):
+        self.packets += 1
+        if self.interval == 0.0:
+            return 0.0
+        delay = self.start + self.packets * self.interval - time.monotonic()
+        if delay < -self.max_lag:
+            self.resyncs += 1
+            self.reset()
+            return 0.0
+        return delay
+
+    def wait(self):
+        delay = self._next_delay()
+        if delay > 0:
+            time.sleep(delay)
+        elif self.interval == 0.0:
+            time.sleep(0)  # unpaced: still let the sender threads run
+
+    async def wait_async(self):
+        delay = self._next_delay()
+        await asyncio.sleep(delay if delay > 0 else 0)
+
+    def effective_rate(self):
+        # Samples per second actually produced since the last reset
+        elapsed = time.monotonic() - self.start
+        return self.packets * self.samples_per_packet / elapsed if elapsed > 0 else 0.0
+
+    def describe(self):
+        return "max throughput" if self.speed == MAX_THROUGHPUT else f"{self.speed:g}x"
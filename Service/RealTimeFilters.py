@@ -0,0 +1,153 @@
+import time
+import numpy as np
+from scipy.signal import butter, iirnotch, sosfilt, sosfilt_zi, tf2sos
+
+# Causal filters for the live stream. Every stage works on a whole (channels, samples)
+# packet at once and keeps its state between packets, so consecutive 18-sample packets
+# are filtered as one continuous signal.
+
+
+class SosFilter:
+    def __init__(self, sos, name=""):
+        self.sos = np.asarray(sos, dtype=np.float64)
+        self.name = name
+        self.zi = None
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, block: np.ndarray):
+        if self.zi is None or self.zi.shape[1] != block.shape[0]:
+            # Start in steady state for the first sample of every channel instead of from zero
+            self.zi = sosfilt_zi(self.sos)[:, np.newaxis, :] * block[np.newaxis, :, :1]
+        filtered, self.zi = sosfilt(self.sos, block, axis=-1, zi=self.zi)
+        return filtered
+
+
+def bandpass(fs, lowcut=20.0, highcut=450.0, order=4):
+    return SosFilter(butter(order, [lowcut, highcut], btype='band', fs=fs, output='sos'),
+                     f"Bandpass {lowcut:g}-{highcut:g} Hz")
+
+
+def highpass(fs, cutoff=20.0, order=4):
+    return SosFilter(butter(order, cutoff, btype='high', fs=fs, output='sos'), f"High-pass {cutoff:g} Hz")
+
+
+def notch(fs, frequency=50.0, quality=30.0):
+    b, a = iirnotch(frequency, quality, fs=fs)
+    return SosFilter(tf2sos(b, a), f"Notch {frequency:g} Hz")
+
+
+class SlidingRMS:
+    """Per-sample RMS over the last `window` samples of every channel.
+
+    The squares of the last window samples live in a (channels, window) ring. Every new
+    sample adds its square to a running sum and subtracts the square leaving the window,
+    so a packet costs O(channels * samples) whatever the window length. The sums are
+    recomputed exactly every `resum_every` packets to stop floating point drift.
+    """
+
+    def __init__(self, window, name="", resum_every=1000):
+        self.window = max(1, int(window))
+        self.name = name or f"RMS {self.window} samples"
+        self.resum_every = resum_every
+        self.reset()
+
+    def reset(self):
+        self.ring = None
+        self.sums = None
+        self.pos = 0
+        self.filled = 0
+        self.packets = 0
+
+    def process(self, block: np.ndarray):
+        if self.ring is None or self.ring.shape[0] != block.shape[0]:
+            self.reset()
+            self.ring = np.zeros((block.shape[0], self.window))
+            self.sums = np.zeros(block.shape[0])
+        out = np.empty(block.shape)
+        # Packets longer than the window are split so no square leaves before it entered
+        for start in range(0, block.shape[1], self.window):
+            piece = block[:, start:start + self.window]
+            out[:, start:start + piece.shape[1]] = self._process(piece)
+        self.packets += 1
+        if self.packets % self.resum_every == 0:
+            self.sums = self.ring.sum(axis=1)
+        return out
+
+    def _process(self, block):
+        n = block.shape[1]
+        squares = np.square(block, dtype=np.float64)
+        idx = (self.pos + np.arange(n)) % self.window
+        running = self.sums[:, np.newaxis] + np.cumsum(squares - self.ring[:, idx], axis=1)
+        self.ring[:, idx] = squares
+        self.sums = running[:, -1].copy()
+        self.pos = (self.pos + n) % self.window
+        counts = np.minimum(self.filled + np.arange(1, n + 1), self.window)
+        self.filled = min(self.filled + n, self.window)
+        return np.sqrt(np.maximum(running, 0.0) / counts)
+
+
+class FilterChain:
+    """Runs packets through a list of SosFilter stages and measures the cost per packet.
+
+    budget is the time one packet may take (default: 10 % of the packet duration);
+    packets above it are counted in over_budget.
+    """
+
+    def __init__(self, stages, fs, samples_per_packet=18, budget=None):
+        self.stages = list(stages)
+        self.budget = budget if budget is not None else 0.1 * samples_per_packet / fs
+        self.packets = 0
+        self.over_budget = 0
+        self.last_cost = 0.0
+        self.mean_cost = 0.0
+        self.max_cost = 0.0
+
+    @property
+    def name(self):
+        return " + ".join(stage.name for stage in self.stages) or "Raw"
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+    def process(self, block: np.ndarray):
+        t0 = time.perf_counter()
+        out = np.asarray(block, dtype=np.float64)
+        for stage in self.stages:
+            out = stage.process(out)
+        cost = time.perf_counter() - t0
+        self.packets += 1
+        self.last_cost = cost
+        self.mean_cost += (cost - self.mean_cost) / min(self.packets, 1000)
+        self.max_cost = max(self.max_cost, cost)
+        if cost > self.budget:
+            self.over_budget += 1
+        return out.astype(np.float32)
+
+    def stats(self):
+        return {"packets": self.packets, "mean_us": self.mean_cost * 1e6, "max_us": self.max_cost * 1e6,
+                "budget_us": self.budget * 1e6, "over_budget": self.over_budget}
+
+
+def rms(fs, window_ms=100.0):
+    return SlidingRMS(round(window_ms * fs / 1000.0), f"RMS {window_ms:g} ms")
+
+
+FILTER_PRESETS = {
+    "RMS": lambda fs, rms_ms: [rms(fs, rms_ms)],
+    "Bandpass": lambda fs, rms_ms: [bandpass(fs)],
+    "High-pass": lambda fs, rms_ms: [highpass(fs)],
+    "Notch 50 Hz": lambda fs, rms_ms: [notch(fs, 50.0)],
+    "Notch 60 Hz": lambda fs, rms_ms: [notch(fs, 60.0)],
+    "Bandpass + Notch 50 Hz": lambda fs, rms_ms: [bandpass(fs), notch(fs, 50.0)],
+    "Bandpass + Notch 60 Hz": lambda fs, rms_ms: [bandpass(fs), notch(fs, 60.0)],
+    "Bandpass + RMS": lambda fs, rms_ms: [bandpass(fs), rms(fs, rms_ms)],
+}
+
+
+def make_filter_chain(name, fs, samples_per_packet=18, rms_window_ms=100.0):
+    # None for "Raw", packets are passed through untouched
+    builder = FILTER_PRESETS.get(name)
+    return FilterChain(builder(fs, rms_window_ms), fs, samples_per_packet) if builder else None
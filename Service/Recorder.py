@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import queue
+import threading
+import time
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.EMGProtocol import SAMPLES_PER_PACKET, SEQ_MODULO
+from Service.Metrics import REGISTRY, RateLimitedLogger
+from Service.RecordingFile import CHUNKED_FORMAT_NAME, CHUNKED_HEADER, FORMAT_VERSION, MAX_GAP_SECONDS
+
+FSYNC_NONE = "none"    # rename only: safe against a crash of the app, not against power loss
+FSYNC_CHUNK = "chunk"  # every chunk and header is on disk before the next one is started
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_CHUNK)
+
+RECORDED_FRAMES = REGISTRY.counter("emg_recorder_frames_total", "Frames written by the stream recorder")
+RECORDED_BYTES = REGISTRY.counter("emg_recorder_bytes_total", "Sample bytes written by the stream recorder")
+RECORDER_DROPPED = REGISTRY.counter("emg_recorder_dropped_frames_total", "Frames dropped because the recorder queue was full")
+RECORDER_QUEUE = REGISTRY.gauge("emg_recorder_queue_depth", "Frames waiting for the recorder thread")
+
+
+class StreamRecorder:
+    """Writes every received frame to a chunked recording directory from a background thread.
+
+    submit() runs on the GUI thread and only puts the frame into a bounded queue; when the
+    writer falls behind, new frames are dropped and counted instead of blocking. The writer
+    collects frames into a preallocated chunk of chunk_seconds and writes it in one go as
+    chunk_NNNNNN.npy (tmp file, then rename), followed by header.json. A change of the
+    subscribed channels or of the sampling rate starts a new recording directory. Sequence gaps are kept in the
+    header as [sample_index, missing_frames]; a jump backwards (server restart) or longer
+    than max_gap_seconds is not lost data to be zero-filled, it also starts a new
+    directory. Load the result with load_recording.
+    """
+
+    def __init__(self, directory, sampling_rate=2000, chunk_seconds=5.0, queue_size=2048, fsync=FSYNC_CHUNK,
+                 samples_per_packet=SAMPLES_PER_PACKET, max_gap_seconds=MAX_GAP_SECONDS):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}', expected one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.stream_rate = sampling_rate  # rate of submitted frames, set_sampling_rate changes it
+        self.samples_per_packet = samples_per_packet
+        self.chunk_seconds = chunk_seconds
+        self.max_gap_seconds = max_gap_seconds
+        self.fsync = fsync
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.dropped = 0
+        self.frames = 0
+        self.paths = []  # recording directories, a new one per channel set
+        self.log = RateLimitedLogger("Recorder", interval=5.0)
+        self._reset_recording()
+
+    def _reset_recording(self):
+        self.path = None
+        self.channels = None
+        self.sampling_rate = None
+        self.buffer = None
+        self.fill = 0
+        self.n_chunks = 0
+        self.n_samples = 0  # committed to chunk files
+        self.gaps = []
+        self.expected_seq = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f"[Recorder] {time.strftime('%H:%M:%S')} Recording to {self.directory}, Chunk: {self.chunk_seconds:g} s, Fsync: {self.fsync}")
+
+    def submit(self, frame: np.ndarray, header):
+        # GUI thread: never blocks, frames are not modified after decoding so no copy is needed
+        try:
+            self.queue.put_nowait((frame, header.seq, header.channels, self.stream_rate))
+        except queue.Full:
+            self.dropped += 1
+            RECORDER_DROPPED.inc()
+            self.log.log("dropped", f"Writer behind, dropped frame {header.seq}, Dropped: {self.dropped}")
+            return False
+        RECORDER_QUEUE.set(self.queue.qsize())
+        return True
+
+    def set_sampling_rate(self, sampling_rate):
+        # Frames submitted from now on belong to a recording at this rate
+        self.stream_rate = sampling_rate
+
+    def stop(self, timeout=10.0):
+        """Writes everything queued so far, then closes the current recording."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+        print(f"[Recorder] {time.strftime('%H:%M:%S')} Stopped, Frames: {self.frames}, Dropped: {self.dropped}, Recordings: {self.paths}")
+
+    def stats(self):
+        return {"frames": self.frames, "dropped": self.dropped, "queue_depth": self.queue.qsize(),
+                "path": self.path, "samples": self.n_samples + self.fill}
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.chunk_seconds)
+            except queue.Empty:
+                # Stream stopped or paused: do not keep a partial chunk in memory only
+                if self.fill:
+                    self._commit_chunk()
+                continue
+            if item is None:
+                break
+            try:
+                self._append(*item)
+            except Exception as e:
+                self.log.log("error", f"Write error: {e}")
+            RECORDER_QUEUE.set(self.queue.qsize())
+        try:
+            self._close()
+        except Exception as e:
+            print(f"[Recorder] {time.strftime('%H:%M:%S')} Close error: {e}")
+
+    def _open(self, channels, sampling_rate):
+        name = time.strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.directory, name + ".emgrec")
+        suffix = 1
+        while os.path.exists(path):
+            suffix += 1
+            path = os.path.join(self.directory, f"{name}_{suffix}.emgrec")
+        os.makedirs(path)
+        self.path = path
+        self.channels = list(channels)
+        self.sampling_rate = sampling_rate
+        per_packet = self.samples_per_packet
+        self.chunk_samples = max(1, int(round(self.chunk_seconds * sampling_rate / per_packet))) * per_packet
+        self.max_gap_frames = min(int(self.max_gap_seconds * sampling_rate / per_packet), SEQ_MODULO // 2)
+        self.buffer = np.empty((len(self.channels), self.chunk_samples), dtype=np.float32)
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.paths.append(path)
+        self._write_header(complete=False)
+        print(f"[Recorder] {time.strftime('%H:%M:%S')} Started {path}, Channels: {len(self.channels)}")
+
+    def _append(self, frame, seq, channels, sampling_rate):
+        new_recording = self.channels != channels or self.sampling_rate != sampling_rate
+        if not new_recording and self.expected_seq is not None and seq != self.expected_seq:
+            missing = (seq - self.expected_seq) % SEQ_MODULO
+            if missing <= self.max_gap_frames:
+                self.gaps.append([self.n_samples + self.fill, missing])
+            else:
+                print(f"[Recorder] {time.strftime('%H:%M:%S')} Sequence jumped from {self.expected_seq} to {seq}, starting a new recording")
+                new_recording = True
+        if new_recording:
+            self._close()
+            self._open(channels, sampling_rate)
+        self.expected_seq = (seq + 1) % SEQ_MODULO
+        pos = 0
+        n = frame.shape[1]
+        while pos < n:
+            take = min(n - pos, self.chunk_samples - self.fill)
+            self.buffer[:, self.fill:self.fill + take] = frame[:, pos:pos + take]
+            self.fill += take
+            pos += take
+            if self.fill == self.chunk_samples:
+                self._commit_chunk()
+        self.frames += 1
+        RECORDED_FRAMES.inc()
+
+    def _commit_chunk(self):
+        final = os.path.join(self.path, f"chunk_{self.n_chunks:06d}.npy")
+        data = self.buffer[:, :self.fill]
+        with open(final + ".tmp", "wb") as f:
+            np.lib.format.write_array(f, np.ascontiguousarray(data))
+            self._sync(f)
+        os.replace(final + ".tmp", final)
+        self.n_chunks += 1
+        self.n_samples += self.fill
+        RECORDED_BYTES.inc(data.nbytes)
+        self.fill = 0
+        self._write_header(complete=False)
+
+    def _write_header(self, complete):
+        header = {
+            "format": CHUNKED_FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "sampling_frequency": self.sampling_rate,
+            "n_channels": len(self.channels),
+            "channels": self.channels,
+            "n_samples": self.n_samples,
+            "n_chunks": self.n_chunks,
+            "samples_per_window": self.samples_per_packet,
+            "started": self.started,
+            "complete": complete,
+            "dropped_frames": self.dropped,
+            "gaps": self.gaps,
+        }
+        path = os.path.join(self.path, CHUNKED_HEADER)
+        with open(path + ".tmp", "w") as f:
+            json.dump(header, f, indent=2)
+            self._sync(f)
+        os.replace(path + ".tmp", path)
+        if self.fsync == FSYNC_CHUNK and hasattr(os, "O_DIRECTORY"):
+            # Makes the renames themselves durable
+            fd = os.open(self.path, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _sync(self, f):
+        if self.fsync == FSYNC_CHUNK:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _close(self):
+        if self.path is None:
+            return
+        if self.fill:
+            self._commit_chunk()
+        self._write_header(complete=True)
+        print(f"[Recorder] {time.strftime('%H:%M:%S')} Closed {self.path}, Samples: {self.n_samples}, Chunks: {self.n_chunks}, Gaps: {len(self.gaps)}")
+        self._reset_recording()
@@ -0,0 +1,235 @@
+import os
+import glob
+import json
+import pickle
+import time
+import sys
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.EMGProtocol import SEQ_MODULO
+
+# Converted recordings are a channel-contiguous float32 .npy file, shape (channels, samples),
+# next to a small JSON header with the same base name. Both the server and SignalModel open
+# the .npy with mmap_mode='r', so startup does not read the signal and the OS page cache
+# is shared between processes.
+FORMAT_NAME = "emg-raw"
+FORMAT_VERSION = 1
+# Live recordings (see Recorder.StreamRecorder) are a directory with header.json and
+# chunk_NNNNNN.npy files of shape (channels, samples). Chunks appear by an atomic rename,
+# so after a crash every chunk_*.npy is complete; header.json counts the committed ones.
+# load_recording joins them into signal.npy in the same directory, with the sequence gaps
+# filled with zeros, and memory-maps that. It joins again when the committed count grew.
+CHUNKED_FORMAT_NAME = "emg-chunked"
+CHUNKED_HEADER = "header.json"
+CONSOLIDATED_NAME = "signal.npy"
+# Longest sequence gap that is zero-filled, longer jumps start a new recording directory
+MAX_GAP_SECONDS = 10.0
+
+
+class Recording:
+    def __init__(self, signal, sampling_rate, info, path):
+        self.signal = signal  # (n_channels, n_samples), np.memmap for converted files
+        self.sampling_rate = sampling_rate
+        self.info = info
+        self.path = path
+
+    @property
+    def n_channels(self):
+        return self.signal.shape[0]
+
+    @property
+    def n_samples(self):
+        return self.signal.shape[1]
+
+
+def converted_paths(pkl_path):
+    base = os.path.splitext(pkl_path)[0]
+    return base + ".npy", base + ".json"
+
+
+def _to_json(value):
+    if isinstance(value, dict):
+        return {str(k): _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def _read_pkl(pkl_path):
+    with open(pkl_path, "rb") as f:
+        rec = pickle.load(f)
+    if "device_information" not in rec or "biosignal" not in rec:
+        raise ValueError("Invalid pkl file format: missing 'device_information' or 'biosignal'.")
+    info = rec["device_information"]
+    sig = rec["biosignal"]
+    n_channels = info.get("number_of_biosignal_channels", sig.shape[0])
+    return sig[:n_channels], info
+
+
+def convert_pkl(pkl_path, out_path=None):
+    """Writes the (C, M, K) biosignal of a pkl recording as a (C, M*K) float32 .npy plus JSON header."""
+    sig, info = _read_pkl(pkl_path)
+    C, M, K = sig.shape
+    npy_path, json_path = converted_paths(out_path or pkl_path)
+    out = np.lib.format.open_memmap(npy_path, mode="w+", dtype=np.float32, shape=(C, M * K))
+    for c in range(C):
+        # window-major order, same as SignalModel: sample m of window k lands at k * M + m
+        out[c] = sig[c].T.reshape(-1)
+    out.flush()
+    del out
+    header = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "sampling_frequency": _to_json(info.get("sampling_frequency")),
+        "n_channels": C,
+        "n_samples": M * K,
+        "samples_per_window": M,
+        "source": os.path.basename(pkl_path),
+        "device_information": _to_json(info),
+    }
+    with open(json_path, "w") as f:
+        json.dump(header, f, indent=2)
+    print(f"[RecordingFile] {time.strftime('%H:%M:%S')} Converted {pkl_path} -> {npy_path}, Shape: ({C}, {M * K})")
+    return npy_path
+
+
+def resolve_recording_path(path):
+    # Prefer an up-to-date converted file next to a requested .pkl
+    if path.endswith(".pkl"):
+        npy_path, json_path = converted_paths(path)
+        if os.path.exists(npy_path) and os.path.exists(json_path):
+            if not os.path.exists(path) or os.path.getmtime(npy_path) >= os.path.getmtime(path):
+                return npy_path
+    return path
+
+
+def chunk_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, "chunk_*.npy")))
+
+
+def read_chunked_header(directory):
+    with open(os.path.join(directory, CHUNKED_HEADER)) as f:
+        header = json.load(f)
+    if header.get("format") != CHUNKED_FORMAT_NAME:
+        raise ValueError(f"Unknown recording format in {directory}: {header.get('format')}")
+    return header
+
+
+def gap_samples(header):
+    """[(recorded sample index, missing samples)] of the sequence gaps inside the committed samples.
+
+    Gaps are capped at MAX_GAP_SECONDS; backward jumps are dropped, they are a restarted
+    stream and not lost samples.
+    """
+    per_window = header.get("samples_per_window", 1)
+    limit = int(MAX_GAP_SECONDS * (header.get("sampling_frequency") or 2000))
+    gaps = []
+    for index, missing in header.get("gaps", []):
+        if not 0 < index < header["n_samples"] or missing >= SEQ_MODULO // 2:
+            continue
+        if missing * per_window > limit:
+            print(f"[RecordingFile] {time.strftime('%H:%M:%S')} Gap of {missing} frames at sample {index} capped to {limit} samples")
+        gaps.append((int(index), min(int(missing) * per_window, limit)))
+    return gaps
+
+
+def consolidated_length(header):
+    return header["n_samples"] + sum(missing for _, missing in gap_samples(header))
+
+
+def consolidate_chunks(directory, header=None):
+    """Joins the committed chunks of a recorder directory into one (channels, samples) signal.npy.
+
+    Only the n_chunks chunks counted in header.json are used; a chunk renamed into place
+    just before a crash is not part of the recording yet. Sequence gaps are filled with
+    zeros, so sample k of signal.npy is at k / sampling_frequency like in the stream.
+    """
+    header = header or read_chunked_header(directory)
+    chunks = chunk_paths(directory)[:header["n_chunks"]]
+    if not chunks or not header["n_samples"]:
+        raise ValueError(f"No recorded chunks in {directory}")
+    arrays = [np.load(c, mmap_mode="r") for c in chunks]
+    recorded = sum(a.shape[1] for a in arrays)
+    if len(chunks) < header["n_chunks"] or recorded != header["n_samples"]:
+        raise ValueError(f"{directory} has {len(chunks)} chunks with {recorded} samples, "
+                         f"header.json counts {header['n_chunks']} with {header['n_samples']}")
+    gaps = gap_samples(header)
+    n_channels = arrays[0].shape[0]
+    out_path = os.path.join(directory, CONSOLIDATED_NAME)
+    tmp_path = out_path + ".tmp"
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32,
+                                    shape=(n_channels, consolidated_length(header)))
+    src = dst = 0  # recorded and consolidated sample positions
+    g = 0
+    for a in arrays:
+        pos = 0
+        while pos < a.shape[1]:
+            if g < len(gaps) and gaps[g][0] == src:
+                out[:, dst:dst + gaps[g][1]] = 0.0
+                dst += gaps[g][1]
+                g += 1
+                continue
+            end = a.shape[1] if g == len(gaps) else min(a.shape[1], pos + gaps[g][0] - src)
+            out[:, dst:dst + end - pos] = a[:, pos:end]
+            src += end - pos
+            dst += end - pos
+            pos = end
+    out.flush()
+    del out
+    os.replace(tmp_path, out_path)
+    print(f"[RecordingFile] {time.strftime('%H:%M:%S')} Joined {len(chunks)} chunks of {directory}, "
+          f"Shape: ({n_channels}, {dst}), Gaps: {len(gaps)}")
+    return out_path
+
+
+def _load_chunked(directory, fs=None):
+    header = read_chunked_header(directory)
+    signal_path = os.path.join(directory, CONSOLIDATED_NAME)
+    signal = np.load(signal_path, mmap_mode="r") if os.path.exists(signal_path) else None
+    # The committed sample count only grows, a join of fewer samples is from an earlier state
+    if signal is None or signal.shape[1] != consolidated_length(header):
+        del signal
+        consolidate_chunks(directory, header)
+        signal = np.load(signal_path, mmap_mode="r")
+    sampling_rate = header.get("sampling_frequency") or fs
+    return Recording(signal, sampling_rate, header, directory)
+
+
+def load_recording(path, fs=None):
+    """Opens a recording as a Recording with a (channels, samples) signal.
+
+    .npy files (see convert_pkl) and recorder directories are memory-mapped read-only.
+    .pkl files are loaded into memory and reshaped, use convert_pkl once to get instant startup.
+    """
+    path = resolve_recording_path(path)
+    if os.path.isdir(path):
+        return _load_chunked(path, fs)
+    if path.endswith(".npy"):
+        json_path = os.path.splitext(path)[0] + ".json"
+        with open(json_path) as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT_NAME:
+            raise ValueError(f"Unknown recording format in {json_path}: {header.get('format')}")
+        signal = np.load(path, mmap_mode="r")
+        info = header.get("device_information", {})
+        sampling_rate = header.get("sampling_frequency") or fs
+        return Recording(signal, sampling_rate, info, path)
+    sig, info = _read_pkl(path)
+    C, M, K = sig.shape
+    signal = np.ascontiguousarray(sig.transpose(0, 2, 1).reshape(C, M * K))
+    return Recording(signal, info.get("sampling_frequency", fs), info, path)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert a recording.pkl to the memory-mapped .npy/.json format")
+    parser.add_argument("pkl", help="pkl recording with 'biosignal' and 'device_information'")
+    parser.add_argument("-o", "--output", default=None, help="output base path, defaults to the pkl path")
+    args = parser.parse_args()
+    convert_pkl(args.pkl, args.output)
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class MultiChannelRingBuffer:
+    """Fixed-capacity (channels, capacity) sample store indexed by absolute sample number.
+
+    Every sample is written twice, at position p and p + capacity of a (channels,
+    2 * capacity) array, so the newest n <= capacity samples are always one contiguous
+    slice. latest() and since() return views into that array without copying; a view
+    stays valid until `capacity` further samples have been appended.
+    """
+
+    def __init__(self, n_channels, capacity, dtype=np.float32):
+        self.capacity = int(capacity)
+        self.dtype = dtype
+        self.reset(n_channels)
+
+    def reset(self, n_channels=None):
+        if n_channels is not None and (not hasattr(self, "data") or n_channels != self.n_channels):
+            self.n_channels = n_channels
+            self.data = np.zeros((n_channels, 2 * self.capacity), dtype=self.dtype)
+        self.total = 0  # absolute number of the next sample to be written
+
+    @property
+    def available(self):
+        return min(self.total, self.capacity)
+
+    @property
+    def oldest(self):
+        # Absolute number of the oldest sample still held
+        return self.total - self.available
+
+    def append(self, block: np.ndarray):
+        n = block.shape[1]
+        if n > self.capacity:
+            self.total += n - self.capacity
+            block = block[:, -self.capacity:]
+            n = self.capacity
+        pos = self.total % self.capacity
+        first = min(n, self.capacity - pos)
+        for offset in (0, self.capacity):
+            self.data[:, offset + pos:offset + pos + first] = block[:, :first]
+            self.data[:, offset:offset + n - first] = block[:, first:]
+        self.total += n
+
+    def latest(self, n: int):
+        """View of the newest min(n, available) samples, (channels, n)."""
+        n = max(0, min(int(n), self.available))
+        end = self.total % self.capacity + self.capacity
+        return self.data[:, end - n:end]
+
+    def since(self, index: int):
+        """(first_index, view) of every held sample with absolute number >= index.
+
+        first_index is later than `index` when those samples were already overwritten.
+        """
+        first = min(max(int(index), self.oldest), self.total)
+        return first, self.latest(self.total - first)
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+import numpy as np
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.Metrics import REGISTRY
+
+# Sampled end-to-end latency tracing of live packets. Every sample_every-th sequence
+# number is followed through the pipeline:
+#   server     header timestamp, set when the server publishes the frame
+#   receive    decoded by TCPClientThread
+#   processor  DataProcessor.process_chunk, i.e. after the Qt signal queue
+#   viewmodel  SignalViewModel.update_realtime_data
+#   plot       written into a plot panel
+#   present    next draw event of that panel's canvas
+# All stamps are wall-clock time.time_ns(), so the "network" and "total" hops are only
+# meaningful when server and client clocks agree (same host or NTP-synced).
+STAGES = ("server", "receive", "processor", "viewmodel", "plot", "present")
+HOPS = (
+    ("network", "server", "receive"),
+    ("qt_queue", "receive", "processor"),
+    ("processing", "processor", "viewmodel"),
+    ("plot_update", "viewmodel", "plot"),
+    ("render", "plot", "present"),
+    ("total", "server", "present"),
+)
+LATENCY_BUCKETS = (1e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5, 1.0)
+
+
+class LatencyTracer:
+    """Collects sampled per-stage stamps and keeps recent hop latencies per hop.
+
+    The GUI-thread stages run synchronously for one packet, so after enter() the later
+    stages only call stamp() and the tracer knows which packet they belong to.
+    """
+
+    def __init__(self, sample_every=16, reservoir_size=2048, max_open=256):
+        self.sample_every = max(1, int(sample_every))
+        self.max_open = max_open
+        self.open = OrderedDict()  # seq -> {stage: ns}
+        self.current = None
+        self.reservoirs = {hop: deque(maxlen=reservoir_size) for hop, _, _ in HOPS}
+        self.completed = deque(maxlen=reservoir_size)
+        self.histograms = {hop: REGISTRY.histogram(f"emg_latency_{hop}_seconds", f"Sampled {hop} latency",
+                                                   LATENCY_BUCKETS) for hop, _, _ in HOPS}
+        self.lock = threading.Lock()
+
+    def set_sample_every(self, n):
+        self.sample_every = max(1, int(n))
+
+    def begin(self, seq, server_ns):
+        # Client thread, for every decoded data frame
+        if seq % self.sample_every:
+            return
+        with self.lock:
+            self.open[seq] = {"seq": seq, "server": server_ns, "receive": time.time_ns()}
+            while len(self.open) > self.max_open:
+                self.open.popitem(last=False)  # never reached a plot, e.g. while paused
+
+    def enter(self, seq, stage):
+        # First GUI-thread stage of a packet, later stages of the same packet use stamp()
+        self.current = seq if seq in self.open else None
+        self.stamp(stage)
+
+    def stamp(self, stage):
+        if self.current is None:
+            return
+        with self.lock:
+            trace = self.open.get(self.current)
+            if trace is not None and stage not in trace:
+                trace[stage] = time.time_ns()
+
+    def present(self):
+        # Draw event of a canvas: every plotted packet is on screen now
+        now = time.time_ns()
+        with self.lock:
+            done = [seq for seq, trace in self.open.items() if "plot" in trace]
+            traces = [self.open.pop(seq) for seq in done]
+        for trace in traces:
+            trace["present"] = now
+            for hop, start, end in HOPS:
+                if start in trace and end in trace:
+                    seconds = (trace[end] - trace[start]) / 1e9
+                    self.reservoirs[hop].append(seconds)
+                    self.histograms[hop].observe(seconds)
+            self.completed.append(trace)
+
+    def stats(self):
+        """hop -> {"count", "p50_ms", "p99_ms"} over the most recent traces."""
+        result = {}
+        for hop, values in self.reservoirs.items():
+            data = np.fromiter(values, dtype=np.float64)
+            if data.size:
+                p50, p99 = np.percentile(data, (50, 99)) * 1e3
+            else:
+                p50 = p99 = float("nan")
+            result[hop] = {"count": int(data.size), "p50_ms": float(p50), "p99_ms": float(p99)}
+        return result
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump({"sample_every": self.sample_every, "stages": STAGES, "stats": self.stats(),
+                       "traces": list(self.completed)}, f, indent=2)
+        print(f"[Tracing] {time.strftime('%H:%M:%S')} Wrote {len(self.completed)} traces to {path}")
+
+
+TRACER = LatencyTracer()
@@ -2,6 +2,7 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from Service.DataProcessorOffline import SignalModel
+from Service.Decimation import minmax_envelope
 from PyQt5.QtCore import QObject, pyqtSignal
 import time
 
@@ -21,6 +22,10 @@ class OfflineViewModel(QObject):
         self.selected_channels = [0] if self.n_channels > 0 else []
         self.time_start = 0.0
         self.time_window = 0.5
+        self.plot_width = 1000  # pixels, longer windows are drawn as a min/max envelope
+        self.lowcut = 20
+        self.highcut = 500
+        self.filter_order = 4
         self.analysis_type = "Time Domain"
         self.data_loaded.emit()  # 立即触发 UI 初始化
 
@@ -38,6 +43,17 @@ class OfflineViewModel(QObject):
         print(f"[OfflineViewModel] Time range set to: {self.time_start:.1f}")
         self._update_plot()
 
+    def set_time_window(self, seconds: float):
+        # 0 or anything past the end shows the whole recording
+        duration = self.model.duration
+        self.time_window = duration if seconds <= 0 else min(seconds, duration)
+        self.time_start = min(self.time_start, max(0.0, duration - self.time_window))
+        print(f"[OfflineViewModel] Time window set to: {self.time_window:.1f} s")
+        self._update_plot()
+
+    def set_plot_width(self, pixels: int):
+        self.plot_width = max(100, int(pixels))
+
     def set_analysis_type(self, analysis_type: str):
         self.analysis_type = analysis_type
         print(f"[OfflineViewModel] Analysis type set to: {analysis_type}")
@@ -50,45 +66,70 @@ class OfflineViewModel(QObject):
             return
 
         time_end = self.time_start + self.time_window
+        # Time plots are relative to the window start, so the x axis stays put while scrubbing
         plot_data = []
 
+        # One vectorized, memoized pass for every channel instead of one per selected channel
+        rms_all = self.model.compute_features(features=("rms",))["rms"]
         for ch_idx in self.selected_channels:
-            rms = self.model.compute_rms(ch_idx)
+            rms = rms_all[ch_idx]
             label = f"Channel {ch_idx} (RMS: {rms:.2f})"
             if self.analysis_type == "Frequency Domain":
-                xf, power = self.model.compute_spectrum(ch_idx)
+                xf, power = self.model.compute_spectrum(ch_idx, self.time_start, time_end)
                 plot_data.append({
                     "x": xf,
                     "y": power,
                     "label": label,
                     "type": "spectrum",
                     "xlabel": "Frequency (Hz)",
-                    "ylabel": "Power",
-                    "title": "Power Spectrum"
+                    "ylabel": "Power Spectral Density",
+                    "title": f"Welch Power Spectrum ({self.time_start:.1f}-{time_end:.1f} s)"
+                })
+            elif self.analysis_type == "Spectrogram":
+                times, freqs, power = self.model.compute_spectrogram(ch_idx, self.time_start, time_end,
+                                                                     max_columns=self.plot_width)
+                plot_data.append({
+                    "x": times,
+                    "y": freqs,
+                    "z": power,
+                    "label": label,
+                    "type": "spectrogram",
+                    "xlabel": "Time (s)",
+                    "ylabel": "Frequency (Hz)",
+                    "title": "Spectrogram"
                 })
             else:
-                t, data = self.model.get_channel_data(ch_idx, self.time_start, time_end)
                 if self.analysis_type == "Bandpass Filter":
-                    filtered = self.model.apply_bandpass_filter(ch_idx)
-                    t, filtered = self.model.get_channel_data(ch_idx, self.time_start, time_end)
+                    # Filtered channels are cached, scrubbing only slices them
+                    t, filtered = self.model.get_filtered_channel_data(ch_idx, self.time_start, time_end,
+                                                                       self.lowcut, self.highcut, self.filter_order)
+                    if len(filtered) > 2 * self.plot_width:
+                        idx, filtered = minmax_envelope(filtered, self.plot_width)
+                        t = t[0] + idx / self.fs
                     plot_data.append({
-                        "x": t,
+                        "x": t - self.time_start,
                         "y": filtered,
+                        "xlim": (0.0, self.time_window),
                         "label": label + " (Filtered)",
                         "type": "time",
-                        "xlabel": "Time (s)",
+                        "xlabel": "Time from window start (s)",
                         "ylabel": "Amplitude",
-                        "title": "Signal Plot"
+                        "title": f"Signal Plot ({self.time_start:.1f}-{time_end:.1f} s)"
                     })
                 else:
+                    if self.time_window * self.fs > 2 * self.plot_width:
+                        t, data = self.model.get_channel_envelope(ch_idx, self.time_start, time_end, self.plot_width)
+                    else:
+                        t, data = self.model.get_channel_data(ch_idx, self.time_start, time_end)
                     plot_data.append({
-                        "x": t,
+                        "x": t - self.time_start,
                         "y": data,
+                        "xlim": (0.0, self.time_window),
                         "label": label + " (Raw)",
                         "type": "time",
-                        "xlabel": "Time (s)",
+                        "xlabel": "Time from window start (s)",
                         "ylabel": "Amplitude",
-                        "title": "Signal Plot"
+                        "title": f"Signal Plot ({self.time_start:.1f}-{time_end:.1f} s)"
                     })
 
         print(f"[OfflineViewModel] {time.strftime('%H:%M:%S')} Plot updated for channels {self.selected_channels}, Time: {self.time_start:.1f}-{time_end:.1f} s")
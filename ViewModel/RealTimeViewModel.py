@@ -1,38 +1,57 @@
-from PyQt5.QtCore import QObject, pyqtSignal
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.RealTimeFilters import make_filter_chain
+from Service.Metrics import REGISTRY, RateLimitedLogger
+from Service.Tracing import TRACER
+from PyQt5.QtCore import QObject, pyqtSignal, QTimer
 import numpy as np
 import time
 
+FILTER_SECONDS = REGISTRY.histogram("emg_filter_seconds", "Real-time filter chain time per packet")
+
 class SignalViewModel(QObject):
     data_updated = pyqtSignal(np.ndarray)
+    frame_updated = pyqtSignal(np.ndarray, object)  # processed block of every subscribed channel
     pause_status_updated = pyqtSignal(bool, str)
     connection_status_updated = pyqtSignal(bool, str)
     invalid_data_warning = pyqtSignal(str)
     color_updated = pyqtSignal(str)
+    metrics_updated = pyqtSignal(dict)  # rates and counters for the status bar, once a second
+    stream_info_updated = pyqtSignal(float, int)  # sampling rate and channel count of the server
 
     def __init__(self, data_processor):
         super().__init__()
         self.data_processor = data_processor
         self.current_channel = 0
-        self.sampling_rate = 2000
+        self.sampling_rate = 2000  # until the server announces its stream, see handle_stream_info
+        self.n_channels = 32
         self.filter_type = "Raw"
+        self.filter_chain = None  # causal filter state for all subscribed channels
+        self.filter_channels = []
         self.color = "lime"
         self.is_plotting = False
-        self.rms_window_size = 18
+        self.rms_window_ms = 100  # sliding RMS window, independent of the packet size
         self.packet_count = 0
+        self.log = RateLimitedLogger("ViewModel", interval=5.0)
+        self.last_snapshot = (time.monotonic(), REGISTRY.snapshot())
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.publish_metrics)
+        self.metrics_timer.start(1000)
 
         self.data_processor.status_updated.connect(self.handle_pause_status)
         self.data_processor.tcp_service.connection_status.connect(self.handle_connection_status)
-        self.data_processor.data_updated.connect(self.update_realtime_data)
+        self.data_processor.frame_updated.connect(self.update_realtime_data)
+        self.data_processor.tcp_service.stream_info.connect(self.handle_stream_info)
 
     def set_channel(self, channel: int):
-        if 0 <= channel < 32:
+        if 0 <= channel < self.n_channels:
             if self.current_channel != channel:
                 self.current_channel = channel
                 self.data_processor.current_channel = channel
-                self.data_processor.clear_full_data()
+                # Every subscribed channel is already streamed, no server round trip or buffer reset
                 self.data_processor.tcp_service.send_channel(channel)
                 print(f"[ViewModel] {time.strftime('%H:%M:%S')} Switched to channel: Ch {channel}")
-            self.update_realtime_data()
 
     def start_plotting(self):
         self.is_plotting = True
@@ -46,15 +65,26 @@ class SignalViewModel(QObject):
 
     def toggle_pause(self):
         self.data_processor.toggle_pause()
-        self.data_processor.tcp_service.toggle_pause()
+        tcp_service = self.data_processor.tcp_service
+        # While recording the server keeps sending and only the display pauses, so a pause
+        # is not a gap in the recording
+        stream_paused = self.data_processor.paused and self.data_processor.recorder is None
+        if tcp_service.paused != stream_paused:
+            tcp_service.toggle_pause()
         self.is_plotting = not self.data_processor.paused
         print(f"[ViewModel] {time.strftime('%H:%M:%S')} Pause toggled, State: {'Paused' if self.data_processor.paused else 'Running'}, Channel: Ch {self.current_channel}")
 
     def set_filter(self, filter_type: str):
         self.filter_type = filter_type
-        self.update_realtime_data()
+        # A new chain starts from fresh state, filters are never switched mid-state
+        self.filter_chain = make_filter_chain(filter_type, self.sampling_rate, rms_window_ms=self.rms_window_ms)
+        self.filter_channels = []
         print(f"[ViewModel] {time.strftime('%H:%M:%S')} Filter changed to: {filter_type}, Channel: Ch {self.current_channel}")
 
+    def set_rms_window(self, window_ms: int):
+        self.rms_window_ms = max(1, int(window_ms))
+        self.set_filter(self.filter_type)
+
     def set_color(self, color: str):
         self.color = color
         self.color_updated.emit(color)
@@ -66,29 +96,58 @@ class SignalViewModel(QObject):
     def handle_connection_status(self, status: bool, message: str):
         self.connection_status_updated.emit(status, message)
 
-    def update_realtime_data(self, data=None):
+    def handle_stream_info(self, sampling_rate: float, n_channels: int):
+        changed = (sampling_rate, n_channels) != (self.sampling_rate, self.n_channels)
+        self.sampling_rate = sampling_rate
+        self.n_channels = n_channels
+        if changed and self.filter_chain is not None:
+            self.set_filter(self.filter_type)  # coefficients and RMS window depend on the rate
+        self.stream_info_updated.emit(sampling_rate, n_channels)
+        print(f"[ViewModel] {time.strftime('%H:%M:%S')} Stream: {n_channels} channels at {sampling_rate:g} Hz")
+
+    def update_realtime_data(self, frame: np.ndarray, channels):
         if not self.is_plotting:
-            print(f"[ViewModel] {time.strftime('%H:%M:%S')} Not plotting, skipping update, Channel: Ch {self.current_channel}")
+            self.log.log("skip", f"Not plotting, skipping update, Channel: Ch {self.current_channel}")
             return
-        if data is None:
-            data = self.data_processor.get_realtime_data(self.current_channel)
-        if data.size == 0:
-            print(f"[ViewModel] {time.strftime('%H:%M:%S')} No data for channel: Ch {self.current_channel}, sending zeros")
-            data = np.zeros(18, dtype=np.float32)
-
+        TRACER.stamp("viewmodel")
         self.packet_count += 1
-        min_val, max_val = np.min(data), np.max(data)
-        print(f"[ViewModel] {time.strftime('%H:%M:%S')} Processing data for Ch {self.current_channel}, Packet {self.packet_count}, Shape: {data.shape}, Amplitude: [{min_val:.2f}, {max_val:.2f}]")
-
-        if self.filter_type == "RMS":
-            if data.size >= self.rms_window_size:
-                rms = np.sqrt(np.mean(data[-self.rms_window_size:]**2))
-                data = np.full(self.rms_window_size, rms)
-                if self.packet_count % 50 == 0:
-                    print(f"[ViewModel] {time.strftime('%H:%M:%S')} RMS calculated: {rms:.2f} for Ch {self.current_channel}, Packet {self.packet_count}")
-            else:
-                print(f"[ViewModel] {time.strftime('%H:%M:%S')} Insufficient data for RMS, Channel: Ch {self.current_channel}")
-                self.invalid_data_warning.emit(f"Insufficient data for RMS, Channel {self.current_channel}")
-                return
-
-        self.data_updated.emit(data)
\ No newline at end of file
+        if self.filter_chain is not None:
+            if channels != self.filter_channels:
+                # Rows now belong to other channels, their filter state no longer applies
+                self.filter_chain.reset()
+                self.filter_channels = list(channels)
+            # One vectorized call filters every subscribed channel and advances all their states
+            frame = self.filter_chain.process(frame)
+            FILTER_SECONDS.observe(self.filter_chain.last_cost)
+            stats = self.filter_chain.stats()
+            self.log.log("filter", f"{self.filter_chain.name}: {stats['mean_us']:.0f} us/packet mean, {stats['max_us']:.0f} us max, {stats['over_budget']} packets over {stats['budget_us']:.0f} us budget")
+        self.frame_updated.emit(frame, channels)
+        if self.current_channel not in channels:
+            return
+        data = frame[channels.index(self.current_channel)]
+        self.log.log("packet", f"Processing data for Ch {self.current_channel}, Packet {self.packet_count}, Shape: {data.shape}")
+
+        self.data_updated.emit(data)
+
+    def publish_metrics(self):
+        # Rates are counter deltas over the time since the previous call
+        now, snapshot = time.monotonic(), REGISTRY.snapshot()
+        then, previous = self.last_snapshot
+        self.last_snapshot = (now, snapshot)
+        elapsed = max(now - then, 1e-6)
+
+        def rate(name):
+            return (snapshot.get(name, 0) - previous.get(name, 0)) / elapsed
+
+        self.metrics_updated.emit({
+            "packets_per_s": rate("emg_client_packets_total"),
+            "bytes_per_s": rate("emg_client_bytes_total"),
+            "fps": rate("emg_render_frames_total"),
+            "lost_frames": snapshot.get("emg_client_lost_frames_total", 0),
+            "invalid_frames": snapshot.get("emg_processor_invalid_frames_total", 0),
+            "receive_buffer_bytes": snapshot.get("emg_client_receive_buffer_bytes", 0),
+            "filter_p99_us": FILTER_SECONDS.quantile(0.99) * 1e6,
+            "latency": TRACER.stats(),
+            "recording": self.data_processor.recorder is not None,
+            "recorder_dropped": snapshot.get("emg_recorder_dropped_frames_total", 0),
+        })
@@ -0,0 +1,439 @@
+import os
+import sys
+import io
+import json
+import time
+import pickle
+import socket
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+import numpy as np
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Service.EMGProtocol import (
+    CHANNELS, SAMPLES_PER_PACKET, MSG_DATA, FrameHeader, FrameReader,
+    mask_from_channels, format_mask, encode_control
+)
+from Service.RecordingFile import convert_pkl
+
+# Headless benchmarks of the streaming and analysis hot paths. Every benchmark returns
+# {name: {"value", "unit", "better"}}; the suite writes them as JSON together with the
+# machine and commit, and --baseline compares a run against an earlier JSON file.
+# Inputs are synthetic signals from fixed seeds, so runs on one machine are comparable.
+
+FS = 2000
+
+
+def result(value, unit, better="lower"):
+    return {"value": float(value), "unit": unit, "better": better}
+
+
+def log(message):
+    print(f"[Bench] {time.strftime('%H:%M:%S')} {message}", file=sys.stderr)
+
+
+def make_recording(directory, seconds, fs=FS, channels=CHANNELS, seed=0):
+    """Synthetic recording in the original pkl layout, converted to .npy; returns the .npy path."""
+    pkl_path = os.path.join(directory, f"bench_{seconds:g}s.pkl")
+    n_windows = int(seconds * fs) // SAMPLES_PER_PACKET
+    rng = np.random.default_rng(seed)
+    signal = (rng.standard_normal((channels, SAMPLES_PER_PACKET, n_windows)) * 500).astype(np.float32)
+    with open(pkl_path, "wb") as f:
+        pickle.dump({"biosignal": signal, "device_information": {
+            "sampling_frequency": fs, "number_of_biosignal_channels": channels}}, f, protocol=4)
+    convert_pkl(pkl_path)
+    return os.path.splitext(pkl_path)[0] + ".npy"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _stream_client(port, channels, deadline, out):
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+    reader = FrameReader()
+    frames = received = 0
+    try:
+        sock.sendall(encode_control(f"start:mask:{format_mask(mask_from_channels(range(channels)))}"))
+        reader.reset_sequence()
+        warm = time.perf_counter() + 0.2  # skip the start-up frames sent before the subscription
+        while time.perf_counter() < warm:
+            reader.recv_from(sock)
+            for _ in reader.read_frames():
+                pass
+        reader.lost_frames = 0
+        start = time.perf_counter()
+        while start + deadline > time.perf_counter():
+            n = reader.recv_from(sock)
+            if n == 0:
+                break
+            received += n
+            for header, _ in reader.read_frames():
+                if header.msg_type == MSG_DATA:
+                    frames += 1
+        out.append((frames, received, reader.lost_frames, time.perf_counter() - start))
+    finally:
+        sock.close()
+
+
+def bench_loopback(channel_counts, client_counts, engines, duration):
+    from Service.EMGServer import EMGTCPServer
+    from Service.EMGAsyncServer import AsyncEMGTCPServer
+    from Service.DataSources import SyntheticEMGSource
+    results = {}
+    for engine in engines:
+        for channels in channel_counts:
+            for clients in client_counts:
+                port = _free_port()
+                server_cls = AsyncEMGTCPServer if engine == "asyncio" else EMGTCPServer
+                with contextlib.redirect_stdout(io.StringIO()):
+                    source = SyntheticEMGSource(max(channels, CHANNELS), FS, duration=20, seed=0)
+                    server = server_cls(host="127.0.0.1", port=port, queue_size=256, speed=0, source=source)
+                    server.start()
+                    time.sleep(0.1)
+                    out = []
+                    threads = [threading.Thread(target=_stream_client, args=(port, channels, duration, out))
+                               for _ in range(clients)]
+                    for t in threads:
+                        t.start()
+                    for t in threads:
+                        t.join()
+                    server.stop()
+                frames = sum(o[0] for o in out)
+                received = sum(o[1] for o in out)
+                lost = sum(o[2] for o in out)
+                elapsed = max(max(o[3] for o in out), 1e-9) if out else 1.0
+                key = f"loopback_{engine}_{channels}ch_{clients}clients"
+                results[key + "_frames_per_s"] = result(frames / elapsed, "frames/s", "higher")
+                results[key + "_MB_per_s"] = result(received / elapsed / 1e6, "MB/s", "higher")
+                results[key + "_loss_pct"] = result(100.0 * lost / max(frames + lost, 1), "%")
+                log(f"{key}: {frames / elapsed:.0f} frames/s, {received / elapsed / 1e6:.1f} MB/s, {lost} lost")
+    return results
+
+
+def bench_shutdown(engines):
+    """stop() with a subscribed client still connected: time taken, and whether the port and client were released."""
+    from Service.EMGServer import EMGTCPServer
+    from Service.EMGAsyncServer import AsyncEMGTCPServer
+    from Service.DataSources import SyntheticEMGSource
+    results = {}
+    for engine in engines:
+        port = _free_port()
+        server_cls = AsyncEMGTCPServer if engine == "asyncio" else EMGTCPServer
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = server_cls(host="127.0.0.1", port=port, queue_size=16,
+                                source=SyntheticEMGSource(CHANNELS, FS, duration=5, seed=0))
+            server.start()
+            sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+            sock.sendall(encode_control("start:mask:all"))
+            reader = FrameReader()
+            reader.recv_from(sock)  # connected and streaming, the client then stops reading
+            time.sleep(0.2)
+            t0 = time.perf_counter()
+            server.stop()
+            elapsed = time.perf_counter() - t0
+        try:
+            sock.settimeout(2)
+            while sock.recv(65536):
+                pass
+            client_closed = True
+        except OSError:
+            client_closed = False
+        finally:
+            sock.close()
+        loop_thread = getattr(server, "loop_thread", None)
+        try:
+            with socket.socket() as s:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                s.bind(("127.0.0.1", port))
+                s.listen()
+            port_free = True
+        except OSError:
+            port_free = False
+        clean = client_closed and port_free and (loop_thread is None or not loop_thread.is_alive())
+        results[f"shutdown_{engine}_with_client_ms"] = result(elapsed * 1e3, "ms")
+        results[f"shutdown_{engine}_clean"] = result(clean, "bool", "higher")
+        log(f"shutdown {engine} with a connected client: {elapsed * 1e3:.0f} ms, "
+            f"{'clean' if clean else 'NOT clean'} (client closed: {client_closed}, port free: {port_free})")
+    return results
+
+
+def bench_source(seconds):
+    from Service.DataSources import SyntheticEMGSource
+    results = {}
+    for channels, fs in ((32, 2000), (256, 10000)):
+        source = SyntheticEMGSource(channels, fs, duration=seconds, seed=0)
+        t0 = time.perf_counter()
+        for index in range(source.n_windows):
+            source.window(index)
+        factor = seconds / (time.perf_counter() - t0)
+        results[f"source_synthetic_{channels}ch_{fs // 1000}khz_realtime_factor"] = result(factor, "x", "higher")
+        log(f"synthetic source {channels} ch @ {fs} Hz: {factor:.1f}x real time")
+    return results
+
+
+def bench_codecs(packets):
+    from Service.Codecs import available_encodings, get_codec
+    from Service.DataSources import SyntheticEMGSource
+    source = SyntheticEMGSource(CHANNELS, FS, duration=packets * SAMPLES_PER_PACKET / FS + 1, seed=5)
+    frames = [source.window(i) for i in range(packets)]
+    batch = np.concatenate(frames[:32], axis=1)  # ~0.3 s, what batching frames before compressing would gain
+    raw = frames[0].size * 4
+    results = {}
+    for name in available_encodings():
+        codec = get_codec(name)
+        payloads = [codec.encode(f) for f in frames]
+        key = "codec_" + name.replace("-", "_").replace("+", "_")
+        results[key + "_bytes_per_frame"] = result(np.mean([len(p) for p in payloads]), "B")
+        results[key + "_ratio"] = result(raw / np.mean([len(p) for p in payloads]), "x", "higher")
+        results[key + "_batch32_ratio"] = result(batch.size * 4 / len(codec.encode(batch)), "x", "higher")
+        results[key + "_encode_us"] = result(_median_us(lambda i: codec.encode(frames[i % packets]), packets), "us")
+        results[key + "_decode_us"] = result(
+            _median_us(lambda i: codec.decode(payloads[i % packets], CHANNELS, SAMPLES_PER_PACKET), packets), "us")
+        decoded = np.concatenate([codec.decode(p, CHANNELS, SAMPLES_PER_PACKET) for p in payloads], axis=1)
+        original = np.concatenate(frames, axis=1)
+        noise = np.mean((decoded - original) ** 2)
+        results[key + "_snr_db"] = result(10 * np.log10(np.mean(original ** 2) / noise) if noise > 0 else 999.0,
+                                          "dB", "higher")
+        log(f"{name}: {results[key + '_ratio']['value']:.2f}x per frame, {results[key + '_batch32_ratio']['value']:.2f}x "
+            f"per 32-frame batch, {results[key + '_encode_us']['value']:.1f} us encode, "
+            f"{results[key + '_decode_us']['value']:.1f} us decode, SNR {results[key + '_snr_db']['value']:.0f} dB")
+    return results
+
+
+def _median_us(fn, repeats):
+    times = np.empty(repeats)
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        fn(i)
+        times[i] = time.perf_counter() - t0
+    return float(np.median(times) * 1e6)
+
+
+def bench_dsp(packets):
+    from Service.RealTimeFilters import FILTER_PRESETS, make_filter_chain
+    from Service.Decimation import StreamingMinMaxDecimator
+    rng = np.random.default_rng(1)
+    block = (rng.standard_normal((CHANNELS, packets * SAMPLES_PER_PACKET)) * 500).astype(np.float32)
+    frames = [block[:, i:i + SAMPLES_PER_PACKET] for i in range(0, block.shape[1], SAMPLES_PER_PACKET)]
+    results = {}
+    for name in FILTER_PRESETS:
+        chain = make_filter_chain(name, FS)
+        chain.process(frames[0])  # first call pays for the initial state
+        key = "dsp_" + name.lower().replace(" + ", "_").replace(" ", "_").replace("-", "") + "_32ch_us_per_packet"
+        results[key] = result(_median_us(lambda i: chain.process(frames[i % packets]), packets), "us")
+    decimator = StreamingMinMaxDecimator(CHANNELS, 60 * FS, 500)
+    results["dsp_minmax_decimator_32ch_us_per_packet"] = result(
+        _median_us(lambda i: decimator.push(frames[i % packets]), packets), "us")
+    return results
+
+
+def bench_pipeline(packets):
+    from PyQt5.QtCore import QObject, pyqtSignal
+    from Service.DataProcessor import DataProcessor
+    from ViewModel.RealTimeViewModel import SignalViewModel
+
+    class FakeClient(QObject):
+        # Stands in for TCPClient: the signals DataProcessor and SignalViewModel connect to
+        data_received = pyqtSignal(np.ndarray, object)
+        connection_status = pyqtSignal(bool, str)
+        stream_info = pyqtSignal(float, int)
+        sampling_rate = None
+
+        def send_channel(self, channel):
+            pass
+
+    rng = np.random.default_rng(2)
+    channels = list(range(CHANNELS))
+    frames = [(rng.standard_normal((CHANNELS, SAMPLES_PER_PACKET)) * 500).astype(np.float32) for _ in range(64)]
+    headers = [FrameHeader(MSG_DATA, 0, CHANNELS, SAMPLES_PER_PACKET, seq, time.time_ns(), channels)
+               for seq in range(packets)]
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        client = FakeClient()
+        processor = DataProcessor(client)
+        vm = SignalViewModel(processor)
+        vm.is_plotting = True
+        for filter_type in ("Raw", "Bandpass + Notch 50 Hz"):
+            vm.set_filter(filter_type)
+            key = f"pipeline_{filter_type.lower().replace(' + ', '_').replace(' ', '_')}_32ch_us_per_packet"
+            results[key] = result(_median_us(lambda i: client.data_received.emit(frames[i % 64], headers[i]),
+                                             packets), "us")
+        # Same raw path with the stream recorder writing every frame to disk in the background
+        vm.set_filter("Raw")
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = processor.start_recording(directory, chunk_seconds=1.0)
+            results["pipeline_raw_recording_32ch_us_per_packet"] = result(
+                _median_us(lambda i: client.data_received.emit(frames[i % 64], headers[i]), packets), "us")
+            processor.stop_recording()
+        results["pipeline_recorder_dropped_frames"] = result(recorder.dropped, "frames")
+        vm.metrics_timer.stop()
+    return results
+
+
+def bench_signal_model(directory, lengths, repeats):
+    from Service.DataProcessorOffline import SignalModel
+    results = {}
+    rng = np.random.default_rng(3)
+    for seconds in lengths:
+        path = make_recording(directory, seconds, seed=int(seconds))
+        key = f"model_{seconds:g}s"
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            model = SignalModel(path)
+            results[key + "_load_ms"] = result((time.perf_counter() - t0) * 1e3, "ms")
+            if model.pyramid is not None and model.pyramid.thread is not None:
+                model.pyramid.thread.join()
+            results[key + "_pyramid_ready_ms"] = result((time.perf_counter() - t0) * 1e3, "ms")
+            duration = model.duration
+            starts = rng.uniform(0, max(duration - 10, 0), repeats)
+
+            results[key + "_range_2s_us"] = result(
+                _median_us(lambda i: model.get_channel_data(i % CHANNELS, starts[i], starts[i] + 2), repeats), "us")
+            results[key + "_envelope_full_ms"] = result(
+                _median_us(lambda i: model.get_channel_envelope(i % CHANNELS, 0, duration, 1000), repeats) / 1e3, "ms")
+
+            def cold_filter(i):
+                model.filter_cache.clear()
+                model.get_filtered_channel_data(i % CHANNELS, starts[i], starts[i] + 2)
+            results[key + "_filter_cold_ms"] = result(_median_us(cold_filter, min(repeats, 5)) / 1e3, "ms")
+            results[key + "_filter_warm_us"] = result(
+                _median_us(lambda i: model.get_filtered_channel_data(0, starts[i], starts[i] + 2), repeats), "us")
+
+            def spectrum(i):
+                model.analysis_cache.clear()
+                model.compute_spectrum(i % CHANNELS, starts[i], starts[i] + 10)
+            results[key + "_spectrum_10s_ms"] = result(_median_us(spectrum, repeats) / 1e3, "ms")
+
+            def features(i):
+                model.analysis_cache.clear()
+                model.compute_features()
+            results[key + "_features_all_ms"] = result(_median_us(features, min(repeats, 3)) / 1e3, "ms")
+        log(f"{key}: " + ", ".join(f"{k[len(key) + 1:]}={v['value']:.2f}{v['unit']}"
+                                   for k, v in results.items() if k.startswith(key)))
+    return results
+
+
+def bench_render(frames):
+    try:
+        from view.plotting_widget import PlotPanel
+        from view.stacked_plot_widget import StackedPlotPanel
+    except Exception as e:
+        log(f"render benchmarks skipped, VisPy/Qt not usable: {e}")
+        return {}
+    rng = np.random.default_rng(4)
+    results = {}
+    packets_per_frame = FS // SAMPLES_PER_PACKET // 60 + 1  # packets arriving between two 60 FPS frames
+    with contextlib.redirect_stdout(io.StringIO()):
+        single = PlotPanel()
+        stacked = StackedPlotPanel()
+        single.show()
+        stacked.show()
+    for window in (0.5, 60):
+        for name, panel in (("single", single), ("stacked32", stacked)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                panel.set_window(window)
+            block = (rng.standard_normal((CHANNELS, SAMPLES_PER_PACKET)) * 500).astype(np.float32)
+
+            def frame(i):
+                for _ in range(packets_per_frame):
+                    if name == "single":
+                        panel.update_data(block[0])
+                    else:
+                        panel.update_frame(block, list(range(CHANNELS)))
+                panel.render()
+            results[f"render_{name}_{window:g}s_us_per_frame"] = result(_median_us(frame, frames), "us")
+    # CPU-side frame preparation only: without a GL context nothing reaches a GPU
+    log("render: " + ", ".join(f"{k}={v['value']:.0f}us" for k, v in results.items()))
+    return results
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "processor": platform.processor(), "cpus": os.cpu_count(), "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results, baseline, tolerance):
+    """Prints every shared metric against the baseline and returns the names of regressions."""
+    regressions = []
+    for name, new in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None or old["value"] == 0:
+            continue
+        ratio = new["value"] / old["value"]
+        worse = ratio > 1 + tolerance if new["better"] == "lower" else ratio < 1 - tolerance
+        if worse:
+            regressions.append(name)
+        print(f"{'REGRESSION' if worse else 'ok':>10}  {name:<60} {old['value']:>12.2f} -> {new['value']:>12.2f} {new['unit']} ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmarks of the EMG streaming and analysis code")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown before a regression is reported")
+    parser.add_argument("--only", default="loopback,source,codec,dsp,pipeline,model,render",
+                        help="comma separated subset of loopback, source, codec, dsp, pipeline, model, render")
+    parser.add_argument("--quick", action="store_true", help="short runs for a smoke test")
+    parser.add_argument("--channels", default="1,8,32,256", help="subscribed channel counts for the loopback benchmark")
+    parser.add_argument("--clients", default="1,8", help="client counts for the loopback benchmark")
+    parser.add_argument("--engines", default="threaded,asyncio", help="server engines for the loopback benchmark")
+    parser.add_argument("--lengths", default=None, help="recording lengths in seconds for the SignalModel benchmark")
+    args = parser.parse_args()
+
+    selected = set(args.only.split(","))
+    lengths = [float(x) for x in args.lengths.split(",")] if args.lengths else ([5, 20] if args.quick else [10, 60, 240])
+    duration = 0.5 if args.quick else 2.0
+    packets = 500 if args.quick else 5000
+    repeats = 5 if args.quick else 20
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        if "loopback" in selected:
+            results.update(bench_loopback([int(x) for x in args.channels.split(",")],
+                                          [int(x) for x in args.clients.split(",")], args.engines.split(","), duration))
+            results.update(bench_shutdown(args.engines.split(",")))
+        if "source" in selected:
+            results.update(bench_source(2 if args.quick else 10))
+        if "codec" in selected:
+            results.update(bench_codecs(packets))
+        if "dsp" in selected:
+            results.update(bench_dsp(packets))
+        if "pipeline" in selected:
+            results.update(bench_pipeline(packets))
+        if "model" in selected:
+            results.update(bench_signal_model(directory, lengths, repeats))
+        if "render" in selected:
+            results.update(bench_render(repeats * 10))
+
+    with open(args.output, "w") as f:
+        json.dump({"machine": machine_info(), "results": results}, f, indent=2)
+    log(f"Wrote {len(results)} results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        log(f"{len(regressions)} regressions beyond {args.tolerance:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
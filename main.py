@@ -1,17 +1,48 @@
+import os
 import sys
+import argparse
 from PyQt5.QtWidgets import QApplication
 from view.mainView import MainWindow
 from ViewModel.RealTimeViewModel import SignalViewModel
 from Service.DataProcessor import DataProcessor
 from Service.EMGClient import TCPClient
+from Service.Metrics import start_metrics_server
+from Service.Tracing import TRACER
+from Service.Recorder import FSYNC_CHUNK, FSYNC_POLICIES
+from Service.Codecs import DEFAULT_ENCODING, available_encodings
 
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Live EMG plotting client")
+    parser.add_argument("--fps", type=int, default=60, help="frame rate of the live plot")
+    parser.add_argument("--metrics-port", type=int, default=os.environ.get("EMG_METRICS_PORT"),
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics (or set EMG_METRICS_PORT)")
+    parser.add_argument("--trace-every", type=int, default=16, help="trace the latency of every Nth packet")
+    parser.add_argument("--trace-dump", default=None, help="write the latency traces to this JSON file on exit")
+    parser.add_argument("--encoding", choices=available_encodings(), default=DEFAULT_ENCODING,
+                        help="payload encoding to request from the server, e.g. int16-delta+zlib for remote links")
+    parser.add_argument("--record", default=None, help="record every received frame into a new recording below this directory")
+    parser.add_argument("--record-fsync", choices=FSYNC_POLICIES, default=FSYNC_CHUNK,
+                        help="chunk: fsync every written chunk, none: leave flushing to the OS")
+    parser.add_argument("--record-chunk-seconds", type=float, default=5.0, help="seconds of signal per recording chunk")
+    parser.add_argument("--offline", default=None,
+                        help="recording for the offline window: .pkl, converted .npy or a --record .emgrec directory")
+    args, qt_args = parser.parse_known_args()
+    if args.metrics_port is not None:
+        start_metrics_server(int(args.metrics_port))
+    TRACER.set_sample_every(args.trace_every)
+    app = QApplication(sys.argv[:1] + qt_args)
     tcp_client = TCPClient()
+    if args.encoding != DEFAULT_ENCODING:
+        tcp_client.set_encoding(args.encoding)
     data_processor = DataProcessor(tcp_service=tcp_client, parent=app)
     view_model = SignalViewModel(data_processor)
-    window = MainWindow(view_model)
+    if args.record:
+        data_processor.start_recording(args.record, chunk_seconds=args.record_chunk_seconds, fsync=args.record_fsync)
+        app.aboutToQuit.connect(data_processor.stop_recording)
+    window = MainWindow(view_model, fps=args.fps, offline_path=args.offline)
     window.show()
+    if args.trace_dump:
+        app.aboutToQuit.connect(lambda: TRACER.dump(args.trace_dump))
     sys.exit(app.exec_())
@@ -37,6 +37,18 @@ class ChannelList(QListWidget):
             item.setData(Qt.UserRole, ch)
             self.addItem(item)
 
+    def set_channel_count(self, count: int):
+        if count == self._channel_count:
+            return
+        current = self.get_current_channel()
+        self._channel_count = count
+        self.blockSignals(True)
+        self._populate()
+        if current is not None:
+            self.setCurrentRow(min(current, count - 1))
+        self.blockSignals(False)
+        print(f"[ChannelList] {time.strftime('%H:%M:%S')} Channel count set to {count}")
+
     def _on_current_item_changed(self, current, previous):
         if current is None:
             return
@@ -4,7 +4,10 @@ from PyQt5.QtCore import pyqtSignal
 class CustomPanel(QWidget):
 
     filter_changed    = pyqtSignal(str)
+    rms_window_changed = pyqtSignal(int)
     color_changed     = pyqtSignal(str)
+    view_changed      = pyqtSignal(str)
+    window_changed    = pyqtSignal(float)
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -25,11 +28,20 @@ class CustomPanel(QWidget):
         filt_tab = QWidget()
         filt_layout = QVBoxLayout(filt_tab)
         self.filt_combo = QComboBox()
-        for name in ("Raw", "RMS"):
+        for name in ("Raw", "RMS", "Bandpass", "High-pass", "Notch 50 Hz", "Notch 60 Hz",
+                     "Bandpass + Notch 50 Hz", "Bandpass + Notch 60 Hz", "Bandpass + RMS"):
             self.filt_combo.addItem(name)
         self.filt_combo.currentTextChanged.connect(self.filter_changed.emit)
         self.filt_combo.setMinimumHeight(80)
         filt_layout.addWidget(self.filt_combo)
+        self.rms_combo = QComboBox()
+        for ms in (50, 100, 150, 200, 250):
+            self.rms_combo.addItem(f"RMS window {ms} ms", ms)
+        self.rms_combo.setCurrentIndex(1)
+        self.rms_combo.currentIndexChanged.connect(
+            lambda index: self.rms_window_changed.emit(self.rms_combo.itemData(index)))
+        self.rms_combo.setMinimumHeight(80)
+        filt_layout.addWidget(self.rms_combo)
         filt_layout.setContentsMargins(5, 5, 5, 5)
 
 
@@ -45,9 +57,29 @@ class CustomPanel(QWidget):
         filt_layout.setContentsMargins(5, 5, 5, 5)
 
 
+        #3.view tab
+        view_tab = QWidget()
+        view_layout = QVBoxLayout(view_tab)
+        self.view_combo = QComboBox()
+        for name in ("Single channel", "All channels"):
+            self.view_combo.addItem(name)
+        self.view_combo.currentTextChanged.connect(self.view_changed.emit)
+        self.view_combo.setMinimumHeight(80)
+        view_layout.addWidget(self.view_combo)
+        self.window_combo = QComboBox()
+        for seconds in (0.5, 2, 10, 30, 60):
+            self.window_combo.addItem(f"Window {seconds:g} s", seconds)
+        self.window_combo.currentIndexChanged.connect(
+            lambda index: self.window_changed.emit(self.window_combo.itemData(index)))
+        self.window_combo.setMinimumHeight(80)
+        view_layout.addWidget(self.window_combo)
+        view_layout.setContentsMargins(5, 5, 5, 5)
+
+
         # add the tabs to the tab widget
         tabs.addTab(filt_tab,   "filters")
         tabs.addTab(color_tab,  "colors")
+        tabs.addTab(view_tab,   "view")
 
         # make the layout
         main_layout = QVBoxLayout(self)
@@ -1,7 +1,8 @@
-from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QSizePolicy, QSplitter
+from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QSizePolicy, QSplitter, QStackedWidget
 from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import Qt
 from view.plotting_widget import PlotPanel, PlotBar
+from view.stacked_plot_widget import StackedPlotPanel
 from view.channels_widget import ChannelList
 from view.custom_widget import CustomPanel
 from view.offlineView import OfflineView
@@ -9,9 +10,10 @@ from ViewModel.OfflineViewModel import OfflineViewModel
 import time
 
 class MainWindow(QMainWindow):
-    def __init__(self, view_model):
+    def __init__(self, view_model, fps=60, offline_path=None):
         super().__init__()
         self.view_model = view_model
+        self.offline_path = offline_path  # recording of the offline window, others/recording.pkl when None
         self.setWindowTitle("Live EMG Plotting")
         self.resize(1450, 900)
         self.setWindowIcon(QIcon("others/icon.png"))
@@ -22,12 +24,17 @@ class MainWindow(QMainWindow):
         self.channel_container = ChannelList()
 
         # 2. Create plotting area
-        self.plot_panel = PlotPanel(max_points=1000, sampling_rate=2000, parent=self)
+        self.plot_panel = PlotPanel(max_points=1000, sampling_rate=view_model.sampling_rate, fps=fps, parent=self)
+        self.stacked_panel = StackedPlotPanel(n_channels=view_model.n_channels, max_points=1000,
+                                              sampling_rate=view_model.sampling_rate, fps=fps, parent=self)
+        self.plot_stack = QStackedWidget()
+        self.plot_stack.addWidget(self.plot_panel)
+        self.plot_stack.addWidget(self.stacked_panel)
         self.plot_bar = PlotBar(self.view_model)
 
         self.plot_container = QWidget()
         self.plot_container.layout = QVBoxLayout()
-        self.plot_container.layout.addWidget(self.plot_panel, stretch=5)
+        self.plot_container.layout.addWidget(self.plot_stack, stretch=5)
         self.plot_container.layout.addWidget(self.plot_bar, stretch=0)
         self.plot_container.setSizePolicy(QSizePolicy.MinimumExpanding,
                                          QSizePolicy.MinimumExpanding)
@@ -66,10 +73,18 @@ class MainWindow(QMainWindow):
         self.plot_bar.offline_button.clicked.connect(self.offline_show)
         self.channel_container.channel_changed.connect(self.change_channel)
         self.custom_container.filter_changed.connect(self.view_model.set_filter)
+        self.custom_container.rms_window_changed.connect(self.view_model.set_rms_window)
         self.custom_container.color_changed.connect(self.view_model.set_color)
+        self.custom_container.view_changed.connect(self.change_view)
+        self.custom_container.window_changed.connect(self.plot_panel.set_window)
+        self.custom_container.window_changed.connect(self.stacked_panel.set_window)
         self.view_model.data_updated.connect(self.plot_panel.update_data)
+        self.view_model.frame_updated.connect(self.stacked_panel.update_frame)
         self.view_model.connection_status_updated.connect(self.plot_bar.status_container.set_connection)
+        self.view_model.metrics_updated.connect(self.plot_bar.status_container.set_metrics)
         self.view_model.color_updated.connect(self.plot_panel.set_color)
+        self.view_model.color_updated.connect(self.stacked_panel.set_color)
+        self.view_model.stream_info_updated.connect(self.change_stream)
 
     def start_plotting(self):
         channel = self.channel_container.get_current_channel()
@@ -92,7 +107,7 @@ class MainWindow(QMainWindow):
 
     def offline_show(self):
         if self.offline_window is None or not self.offline_window.isVisible():
-            self.offline_window = OfflineView()
+            self.offline_window = OfflineView(OfflineViewModel(self.offline_path))
             self.offline_window.show()
         else:
             self.offline_window.raise_()
@@ -101,4 +116,15 @@ class MainWindow(QMainWindow):
     def change_channel(self, channel: int):
         self.view_model.set_channel(channel)
         self.plot_panel.reset_buffer(channel)
-        print(f"[MainWindow] {time.strftime('%H:%M:%S')} Channel changed to: Ch {channel}")
\ No newline at end of file
+        print(f"[MainWindow] {time.strftime('%H:%M:%S')} Channel changed to: Ch {channel}")
+
+    def change_stream(self, sampling_rate: float, n_channels: int):
+        self.channel_container.set_channel_count(n_channels)
+        self.plot_panel.set_sampling_rate(sampling_rate)
+        self.stacked_panel.set_stream(sampling_rate, n_channels)
+        print(f"[MainWindow] {time.strftime('%H:%M:%S')} Stream changed: {n_channels} channels at {sampling_rate:g} Hz")
+
+    def change_view(self, name: str):
+        # Both panels keep receiving data, only the visible one renders
+        self.plot_stack.setCurrentWidget(self.stacked_panel if name == "All channels" else self.plot_panel)
+        print(f"[MainWindow] {time.strftime('%H:%M:%S')} View changed to: {name}")
@@ -2,12 +2,13 @@ from PyQt5.QtWidgets import (
     QWidget, QComboBox, QSlider, QLabel, QVBoxLayout,
     QHBoxLayout
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QIcon
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 from ViewModel.OfflineViewModel import OfflineViewModel
+import numpy as np
 import time
 
 class OfflineView(QWidget):
@@ -19,6 +20,11 @@ class OfflineView(QWidget):
         self.setWindowTitle("Offline Signal Analysis")
         self.setWindowIcon(QIcon("others/icon.png"))
         self.setStyleSheet('background-color:#9AA6B2; font-family: "Segoe UI"')
+        # Artists of the current plot, reused while only the data changes
+        self.ax = None
+        self.lines = []
+        self.plot_layout = None
+        self.background = None
         self._init_ui()
 
     def _init_ui(self):
@@ -34,7 +40,7 @@ class OfflineView(QWidget):
         self.AnalysisLabel.setAlignment(Qt.AlignLeft)
         self.AnalysisLabel.setStyleSheet("font-size: 25px")
         self.analysis_combo = QComboBox()
-        self.analysis_combo.addItems(["Time Domain", "Frequency Domain", "Bandpass Filter"])
+        self.analysis_combo.addItems(["Time Domain", "Frequency Domain", "Spectrogram", "Bandpass Filter"])
         self.analysis_combo.currentTextChanged.connect(self._on_analysis_changed)
         self.analysis_combo.setMinimumHeight(60)
         self.analysis_combo.setStyleSheet('font-size:25px')
@@ -44,6 +50,17 @@ class OfflineView(QWidget):
         self.ChannelLabel.setAlignment(Qt.AlignLeft)
         self.ChannelLabel.setStyleSheet("font-size: 25px")
 
+        # Window length combo
+        self.WindowLabel = QLabel("Window:")
+        self.WindowLabel.setAlignment(Qt.AlignLeft)
+        self.WindowLabel.setStyleSheet("font-size: 25px")
+        self.window_combo = QComboBox()
+        for text, seconds in (("0.5 s", 0.5), ("2 s", 2.0), ("10 s", 10.0), ("60 s", 60.0), ("Full", 0.0)):
+            self.window_combo.addItem(text, seconds)
+        self.window_combo.currentIndexChanged.connect(self._on_window_changed)
+        self.window_combo.setMinimumHeight(60)
+        self.window_combo.setStyleSheet('font-size:25px')
+
         # Time slider
         self.TimeLabel = QLabel("Time range")
         self.TimeLabel.setAlignment(Qt.AlignLeft)
@@ -52,11 +69,19 @@ class OfflineView(QWidget):
         self.time_slider.setMinimum(0)
         self.time_slider.setValue(0)
         self.time_slider.valueChanged.connect(self._on_time_changed)
+        self._update_slider_range()
+        # Slider events are coalesced, only the last position of a drag is rendered
+        self.pending_time = None
+        self.time_timer = QTimer(self)
+        self.time_timer.setSingleShot(True)
+        self.time_timer.setInterval(30)
+        self.time_timer.timeout.connect(self._apply_time_range)
 
         # Matplotlib
         self.figure = Figure(tight_layout=True)
         self.canvas = FigureCanvas(self.figure)
         self.toolbar = NavigationToolbar(self.canvas, self)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
 
         # Layout
         layout = QVBoxLayout()
@@ -70,6 +95,8 @@ class OfflineView(QWidget):
         h_layout.addWidget(self.channel_combo, stretch=1)
         h_layout.addWidget(self.AnalysisLabel)
         h_layout.addWidget(self.analysis_combo, stretch=1)
+        h_layout.addWidget(self.WindowLabel)
+        h_layout.addWidget(self.window_combo, stretch=1)
         h_widget.setLayout(h_layout)
         h_widget.setStyleSheet('background-color: #BCCCDC')
         layout.addWidget(h_widget, stretch=2)
@@ -82,10 +109,7 @@ class OfflineView(QWidget):
             self.canvas.draw()
             return
         self.channel_combo.addItems([f"Ch {i}" for i in range(self.vm.n_channels)])
-        t, _ = self.vm.model.get_channel_data(0, 0, 1)
-        if len(t) > 0:
-            max_time = t[-1]
-            self.time_slider.setMaximum(int(max_time * 10))
+        self._update_slider_range()
         print(f"[OfflineView] {time.strftime('%H:%M:%S')} Data loaded, {self.vm.n_channels} channels available")
         self._on_channel_changed(0)  # Initialize with first channel
 
@@ -96,26 +120,128 @@ class OfflineView(QWidget):
     def _on_analysis_changed(self, analysis_type):
         print(f"[OfflineView] Analysis type changed to: {analysis_type}")
         self.vm.set_analysis_type(analysis_type)
-        # Disable time slider for Frequency Domain, enable for others
-        self.time_slider.setEnabled(analysis_type != "Frequency Domain")
+
+    def _update_slider_range(self):
+        max_start = max(0.0, self.vm.model.duration - self.vm.time_window)
+        self.time_slider.setMaximum(int(max_start * 10))
+
+    def _on_window_changed(self, index):
+        seconds = self.window_combo.itemData(index)
+        print(f"[OfflineView] Window changed to: {self.window_combo.itemText(index)}")
+        self.vm.set_time_window(seconds)
+        self._update_slider_range()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.vm.set_plot_width(self.canvas.width())
 
     def _on_time_changed(self, value):
-        print(f"[OfflineView] Time changed to: {value / 10.0}")
-        self.vm.set_time_range(value / 10.0)
+        self.pending_time = value / 10.0
+        self.time_timer.start()
+
+    def _apply_time_range(self):
+        print(f"[OfflineView] Time changed to: {self.pending_time}")
+        self.vm.set_time_range(self.pending_time)
 
     def _update_plot(self, plot_data):
-        self.figure.clear()
         if not plot_data:
             print(f"[OfflineView] No plot data received")
+            self.figure.clear()
+            self.ax, self.lines, self.plot_layout, self.background = None, [], None, None
             self.canvas.draw()
             return
+        kind = plot_data[0]["type"]
+        layout = (kind, tuple(data["label"] for data in plot_data), plot_data[0]["xlabel"], plot_data[0]["ylabel"])
+        if kind == "spectrogram" or layout != self.plot_layout:
+            self._rebuild_plot(plot_data, layout)
+            return
+        for line, data in zip(self.lines, plot_data):
+            line.set_data(data["x"], data["y"])
+        self.ax.title.set_text(plot_data[0]["title"])
+        if self._fit_limits(plot_data):
+            # Ticks move with the limits, the whole figure has to be drawn again
+            self.canvas.draw_idle()
+        else:
+            self._blit()
+
+    def _rebuild_plot(self, plot_data, layout):
+        self.figure.clear()
+        self.lines, self.plot_layout, self.background = [], layout, None
+        if plot_data[0]["type"] == "spectrogram":
+            self._plot_spectrograms(plot_data)
+            return
         ax = self.figure.add_subplot(1, 1, 1)
+        self.ax = ax
         for i, data in enumerate(plot_data):
-            ax.plot(data["x"], data["y"], label=data["label"], alpha=1.0)
+            # Animated artists are left out of full draws and blitted on top of the background
+            line, = ax.plot(data["x"], data["y"], label=data["label"], alpha=1.0, animated=True)
+            self.lines.append(line)
             ax.set_xlabel(data["xlabel"])
             ax.set_ylabel(data["ylabel"])
             ax.set_title(data["title"])
+        ax.title.set_animated(True)
         ax.grid(True)
         ax.legend()
+        self._fit_limits(plot_data, force=True)
         self.canvas.draw()
-        print(f"[OfflineView] {time.strftime('%H:%M:%S')} Plot updated with {len(plot_data)} channels")
\ No newline at end of file
+        print(f"[OfflineView] {time.strftime('%H:%M:%S')} Plot updated with {len(plot_data)} channels")
+
+    def _plot_spectrograms(self, plot_data):
+        # One subplot and colorbar per channel, a shared axis would stack the meshes on each other
+        axes = self.figure.subplots(len(plot_data), 1, sharex=True, squeeze=False)[:, 0]
+        self.ax = axes[0]
+        for ax, data in zip(axes, plot_data):
+            if data["z"].size:
+                mesh = ax.pcolormesh(data["x"], data["y"], 10 * np.log10(data["z"] + 1e-12), shading="auto")
+                self.figure.colorbar(mesh, ax=ax, label="dB")
+            ax.set_ylabel(data["ylabel"])
+            ax.set_title(f"{data['title']}, {data['label']}")
+        axes[-1].set_xlabel(plot_data[-1]["xlabel"])
+        self.canvas.draw()
+        print(f"[OfflineView] {time.strftime('%H:%M:%S')} Spectrogram updated for {len(plot_data)} channels")
+
+    def _fit_limits(self, plot_data, force=False):
+        # Returns True when the axis limits changed. A fixed "xlim" of the plot data is used
+        # as is. The y range is sticky: it only moves when the data leaves it or fills less
+        # than half of it.
+        xs = [data["x"] for data in plot_data if len(data["x"])]
+        ys = [data["y"] for data in plot_data if len(data["y"])]
+        if not xs or not ys:
+            return False
+        if "xlim" in plot_data[0]:
+            x0, x1 = plot_data[0]["xlim"]
+        else:
+            x0, x1 = min(np.min(x) for x in xs), max(np.max(x) for x in xs)
+        y0, y1 = min(np.nanmin(y) for y in ys), max(np.nanmax(y) for y in ys)
+        if x1 <= x0:
+            x1 = x0 + 1e-9
+        margin = 0.05 * (y1 - y0) if y1 > y0 else max(abs(y0), 1.0) * 0.05
+        ylim = (y0 - margin, y1 + margin)
+        cur_y0, cur_y1 = self.ax.get_ylim()
+        if not force and cur_y0 <= y0 and y1 <= cur_y1 and (y1 - y0) > 0.5 * (cur_y1 - cur_y0):
+            ylim = (cur_y0, cur_y1)
+        changed = force or (x0, x1) != tuple(self.ax.get_xlim()) or ylim != (cur_y0, cur_y1)
+        if changed:
+            self.ax.set_xlim(x0, x1)
+            self.ax.set_ylim(*ylim)
+        return changed
+
+    def _animated_artists(self):
+        return self.lines + ([self.ax.title] if self.ax is not None else [])
+
+    def _on_draw(self, event):
+        # Every full draw refreshes the background, then the animated artists are drawn on it
+        if not self.lines:
+            return
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        for artist in self._animated_artists():
+            self.figure.draw_artist(artist)
+
+    def _blit(self):
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        for artist in self._animated_artists():
+            self.figure.draw_artist(artist)
+        self.canvas.blit(self.figure.bbox)
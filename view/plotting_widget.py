@@ -3,14 +3,29 @@ import numpy as np
 from vispy.scene import SceneCanvas
 from vispy.scene.visuals import Line, Text
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QSizePolicy
+from PyQt5.QtCore import QTimer
 from view.status_printer import StatusLabel
+from Service.Decimation import StreamingMinMaxDecimator
+from Service.Metrics import REGISTRY
+from Service.Tracing import TRACER
 import time
 
+RENDER_FRAMES = REGISTRY.counter("emg_render_frames_total", "Frames drawn by the live plots")
+RENDER_SECONDS = REGISTRY.histogram("emg_render_seconds", "Time to prepare and submit one live plot frame")
+# Line colors offered by the custom panel, shared by the single-channel and stacked plots
+COLOR_MAP = {
+    "White": "white",
+    "Pink": "#FFC0CB",
+    "Neon Blue": "#00FFFF",
+    "Neon Pink": "#FF69B4",
+    "lime": "lime"
+}
+
 
 class PlotPanel(QWidget):
-    def __init__(self, max_points=1000, sampling_rate=2000, parent=None):
+    def __init__(self, max_points=1000, sampling_rate=2000, fps=60, parent=None):
         super().__init__(parent)
-        self.max_points = max_points  # 1000 samples, 0.5 seconds
+        self.max_points = max_points  # vertex budget, 1000 samples = 0.5 seconds undecimated
         self.sampling_rate = sampling_rate  # 2000 Hz
         self.time_step = 1.0 / self.sampling_rate  # 0.0005 seconds
         self.current_channel = 0
@@ -19,21 +34,23 @@ class PlotPanel(QWidget):
 
         # Initialize VisPy canvas with interaction
         self.canvas = SceneCanvas(keys='interactive', bgcolor='#4A628A', parent=self)
+        self.canvas.events.draw.connect(lambda event: TRACER.present())
         self.view = self.canvas.central_widget.add_view()
         self.view.camera = PanZoomCamera(interactive=True)
 
         # Waveform curve
         self.curve = Line(color='white', width=2.0, parent=self.view.scene, method='gl')
-        self.data = np.zeros(max_points, dtype=np.float32)
-        self.times = np.linspace(0, max_points * self.time_step, max_points)
-        self.ptr = 0
+        # Packets only go into self.data, the render timer draws the newest window at most fps
+        # times a second. x stays in window coordinates (t - window start), so the camera and
+        # axis never move while streaming.
+        self.frames_rendered = 0
+        self._allocate(max_points * self.time_step)
 
         # X-axis ticks and labels
         self.axis_line = Line(parent=self.view.scene, color='white')
         self.tick_lines = []
         self.tick_labels = []
-        window_duration = self.max_points * self.time_step
-        self.tick_positions = np.arange(0, window_duration + 0.1, 0.1)  # 0.0, 0.1, ..., 0.5 seconds
+        self.tick_positions = np.arange(0, self.window_duration + 0.1, 0.1)  # 0.0, 0.1, ..., 0.5 seconds
         for _ in self.tick_positions:
             self.tick_lines.append(Line(parent=self.view.scene, color='white'))
             self.tick_labels.append(Text(parent=self.view.scene, color='white', font_size=8))
@@ -55,24 +72,62 @@ class PlotPanel(QWidget):
 
         # Initialize view range
         y_range = (-30000, 30000) if self.current_channel == 0 else (-2000, 2000)
-        self.view.camera.set_range(x=(0, max_points * self.time_step), y=y_range)
+        self.view.camera.set_range(x=(0, self.window_duration), y=y_range)
         self.canvas.update()
         print(f"[PlotPanel] {time.strftime('%H:%M:%S')} Initialized canvas, max_points: {max_points}, sampling_rate: {self.sampling_rate} Hz, y_range: {y_range}")
 
+        self.render_timer = QTimer(self)
+        self.render_timer.timeout.connect(self.render)
+        self.set_fps(fps)
+
         # place it
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 50)
         layout.addWidget(self.canvas.native)
         self.setMinimumHeight(400)
 
-    def update_axis(self):
-        window_duration = self.max_points * self.time_step
-        current_time  = self.sample_count * self.time_step
-
-        if current_time < window_duration:
-            x_min, x_max = 0.0, window_duration
+    def set_fps(self, fps: int):
+        self.fps = max(1, int(fps))
+        self.render_timer.start(int(1000 / self.fps))
+
+    def _allocate(self, seconds):
+        # Windows longer than the vertex budget are drawn as a per-column min/max envelope
+        window_samples = max(1, int(round(seconds * self.sampling_rate)))
+        if window_samples <= self.max_points:
+            self.decimator = None
+            self.data = np.zeros(window_samples, dtype=np.float32)
+            x = np.arange(window_samples) * self.time_step
+            self.window_duration = window_samples * self.time_step
         else:
-            x_min, x_max = current_time - window_duration, current_time
+            self.decimator = StreamingMinMaxDecimator(1, window_samples, self.max_points // 2)
+            self.data = np.zeros(0, dtype=np.float32)
+            x = self.decimator.x * self.time_step
+            self.window_duration = self.decimator.window_samples * self.time_step
+        self.vertices = np.zeros((len(x), 2), dtype=np.float32)
+        self.vertices[:, 0] = x
+        self.ptr = 0
+        self.dirty = True
+
+    def set_sampling_rate(self, sampling_rate: float):
+        # Keeps the window length in seconds, the sample buffer is sized for the new rate
+        if sampling_rate == self.sampling_rate:
+            return
+        seconds = self.window_duration
+        self.sampling_rate = sampling_rate
+        self.time_step = 1.0 / sampling_rate
+        self.set_window(seconds)
+
+    def set_window(self, seconds: float):
+        self._allocate(seconds)
+        y_range = (-30000, 30000) if self.current_channel == 0 else (-2000, 2000)
+        self.view.camera.set_range(x=(0, self.window_duration), y=y_range)
+        self.update_axis()
+        print(f"[PlotPanel] {time.strftime('%H:%M:%S')} Window set to {seconds:g} s, {len(self.vertices)} vertices, {'min/max envelope' if self.decimator else 'raw samples'}")
+
+    def update_axis(self):
+        # Only needed when the window or the y range changes, not per packet
+        window_duration = self.window_duration
+        x_min, x_max = 0.0, window_duration
 
 
         y_min, y_max = (-30000, 30000) if self.current_channel == 0 else (-2000, 2000)
@@ -85,17 +140,23 @@ class PlotPanel(QWidget):
         tick_height  = 0.025 * (y_max - y_min)
         label_offset = 300 if self.current_channel == 0 else 30
 
-        self.tick_positions = np.arange(0, window_duration + 1e-8, 0.1)
+        tick_step = next(step for limit, step in ((1, 0.1), (5, 0.5), (10, 1), (30, 5), (np.inf, 10))
+                         if window_duration <= limit)
+        self.tick_positions = np.arange(0, window_duration + 1e-8, tick_step)
         for i, tick_time in enumerate(self.tick_positions):
             if i >= len(self.tick_lines):
                 self.tick_lines.append(Line(parent=self.view.scene, color='white'))
                 self.tick_labels.append(Text(parent=self.view.scene, color='white',
                                              font_size=8))
             tick_x = x_min + tick_time
+            self.tick_lines[i].visible = True
             self.tick_lines[i].set_data(np.array([[tick_x, x_axis_y],
                                                   [tick_x, x_axis_y + tick_height]]))
-            self.tick_labels[i].text = '' if tick_time == 0 else f'{tick_time:.1f}s'
+            self.tick_labels[i].text = '' if tick_time == 0 else (f'{tick_time:.1f}s' if tick_step < 1 else f'{tick_time:.0f}s')
             self.tick_labels[i].pos  = [tick_x, x_axis_y - label_offset]
+        for i in range(len(self.tick_positions), len(self.tick_lines)):
+            self.tick_lines[i].visible = False
+            self.tick_labels[i].text = ''
 
         self.y_axis_line.set_data(np.array([[x_min, y_min], [x_min, y_max]]))
         y_tick_height = 0.02 * (x_max - x_min)
@@ -114,76 +175,67 @@ class PlotPanel(QWidget):
 
     def update_data(self, new_samples):
         try:
-            if not isinstance(new_samples, np.ndarray):
-                new_samples = np.zeros(18, dtype=np.float32)
-                print(f"[PlotPanel] {time.strftime('%H:%M:%S')} Non-array data received, using zeros, Channel: Ch {self.current_channel}")
-            elif new_samples.size != 18:
-                new_samples = np.zeros(18, dtype=np.float32)
-                print(f"[PlotPanel] {time.strftime('%H:%M:%S')} Incorrect data size {new_samples.size}, using zeros, Channel: Ch {self.current_channel}")
+            if not isinstance(new_samples, np.ndarray) or new_samples.ndim != 1:
+                print(f"[PlotPanel] {time.strftime('%H:%M:%S')} Invalid data received, skipped, Channel: Ch {self.current_channel}")
+                return
 
+            TRACER.stamp("plot")
             n = len(new_samples)
             self.packet_count += 1
             self.sample_count += n
-            if self.packet_count % 50 == 0:
-                print(f"[PlotPanel] {time.strftime('%H:%M:%S')} Received data {self.packet_count} for Ch {self.current_channel}, Samples: {n}, Amplitude: [{np.min(new_samples):.2f}, {np.max(new_samples):.2f}]")
 
-            if n >= self.max_points:
-                self.data[:] = new_samples[-self.max_points:]
+            size = len(self.data)
+            if self.decimator is not None:
+                self.decimator.push(new_samples[np.newaxis, :])
+            elif n >= size:
+                self.data[:] = new_samples[-size:]
                 self.ptr = 0
             else:
-                if self.ptr + n <= self.max_points:
+                if self.ptr + n <= size:
                     self.data[self.ptr:self.ptr + n] = new_samples
                 else:
-                    part = self.max_points - self.ptr
+                    part = size - self.ptr
                     self.data[self.ptr:] = new_samples[:part]
                     self.data[:n - part] = new_samples[part:]
-                self.ptr = (self.ptr + n) % self.max_points
-
-            current_time = self.sample_count * self.time_step
-            window = self.max_points * self.time_step
+                self.ptr = (self.ptr + n) % size
+            self.dirty = True
+        except Exception as e:
+            print(f"[PlotPanel] {time.strftime('%H:%M:%S')} update_data error: {e}")
 
-            if current_time < window:
-                start, end = 0.0, window
+    def render(self):
+        # Whatever number of packets arrived since the last frame costs one redraw
+        if not self.dirty or not self.isVisible():
+            return
+        self.dirty = False
+        t0 = time.perf_counter()
+        try:
+            # Oldest sample at x = 0, newest at the right edge
+            if self.decimator is not None:
+                self.vertices[:, 1] = self.decimator.envelope()[0]
             else:
-                start, end = current_time - window, current_time
-
-            self.times = np.linspace(start, end, self.max_points)
-            vertices = np.vstack((self.times, self.data)).T
-            self.curve.set_data(vertices)
-
-            min_val, max_val = self.data.min(), self.data.max()
+                tail = len(self.data) - self.ptr
+                self.vertices[:tail, 1] = self.data[self.ptr:]
+                self.vertices[tail:, 1] = self.data[:self.ptr]
+            self.curve.set_data(self.vertices)
 
+            min_val, max_val = self.vertices[:, 1].min(), self.vertices[:, 1].max()
             self.y_min_label.text = f'Min: {min_val:.2f}'
             self.y_max_label.text = f'Max: {max_val:.2f}'
-
-            offset_x = start - 0.05 * (end - start)
+            offset_x = -0.05 * self.window_duration
             self.y_min_label.pos = (offset_x, min_val)
             self.y_max_label.pos = (offset_x, max_val)
 
-            y_range = (-30000, 30000) if self.current_channel == 0 else (-2000, 2000)
-            self.view.camera.set_range(x=(start, end), y=y_range)
-
-            self.update_axis()
-
             self.canvas.update()
-            self.canvas.app.process_events()
-            if self.packet_count % 50 == 0:
-                print(f"[PlotPanel] {time.strftime('%H:%M:%S')} Rendered plot {self.packet_count}, Samples: {n}, Channel: Ch {self.current_channel}, y_range: {y_range}")
+            self.frames_rendered += 1
+            RENDER_FRAMES.inc()
+            RENDER_SECONDS.observe(time.perf_counter() - t0)
         except Exception as e:
-            print(f"[PlotPanel] {time.strftime('%H:%M:%S')} update_data error: {e}")
+            print(f"[PlotPanel] {time.strftime('%H:%M:%S')} render error: {e}")
 
     def set_color(self, color: str):
-        color_map = {
-            "White": "white",
-            "Pink": "#FFC0CB",
-            "Neon Blue": "#00FFFF",
-            "Neon Pink": "#FF69B4",
-            "lime": "lime"
-        }
         try:
-            self.curve.set_data(color=color_map.get(color, "lime"))
+            self.curve.set_data(color=COLOR_MAP.get(color, "lime"))
             self.canvas.update()
-            self.canvas.app.process_events()
             print(f"[PlotPanel] {time.strftime('%H:%M:%S')} Color changed to: {color}, Channel: Ch {self.current_channel}")
         except Exception as e:
             print(f"[PlotPanel] {time.strftime('%H:%M:%S')} set_color error: {e}")
@@ -192,17 +244,19 @@ class PlotPanel(QWidget):
         self.packet_count = 0
         self.sample_count = 0
         self.current_channel = channel
-        self.data = np.zeros(self.max_points, dtype=np.float32)
+        self.data[:] = 0.0
+        if self.decimator is not None:
+            self.decimator.reset()
         self.ptr = 0
-        self.times = np.linspace(0, self.max_points * self.time_step, self.max_points)
-        self.curve.set_data(np.vstack((self.times, self.data)).T)
+        self.dirty = False
+        self.vertices[:, 1] = 0.0
+        self.curve.set_data(self.vertices)
         self.y_min_label.text = 'Min: 0.00'
         self.y_max_label.text = 'Max: 0.00'
         y_range = (-30000, 30000) if self.current_channel == 0 else (-2000, 2000)
-        self.view.camera.set_range(x=(0, self.max_points * self.time_step), y=y_range)
+        self.view.camera.set_range(x=(0, self.window_duration), y=y_range)
         self.update_axis()
         self.canvas.update()
-        self.canvas.app.process_events()
         print(f"[PlotPanel] {time.strftime('%H:%M:%S')} Buffer reset for channel: Ch {self.current_channel}, y_range: {y_range}")
 
 class PlotBar(QWidget):
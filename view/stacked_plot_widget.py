@@ -0,0 +1,182 @@
+from vispy.scene.cameras import PanZoomCamera
+import numpy as np
+from vispy.scene import SceneCanvas
+from vispy.scene.visuals import Line, Text
+from PyQt5.QtWidgets import QWidget, QVBoxLayout
+from PyQt5.QtCore import QTimer
+from Service.Decimation import StreamingMinMaxDecimator
+from Service.EMGProtocol import SAMPLES_PER_PACKET
+from view.plotting_widget import COLOR_MAP, RENDER_FRAMES, RENDER_SECONDS
+from Service.Tracing import TRACER
+import time
+
+
+class StackedPlotPanel(QWidget):
+    """All channels stacked in one canvas and drawn by one Line visual.
+
+    The vertices of every channel live in one (n_channels * max_points, 2) buffer and a
+    connect mask breaks the line between channels, so a frame is one buffer upload and one
+    draw call whatever the channel count. Each channel is scaled to its own peak in the
+    window and drawn around its row offset. Windows longer than max_points samples are
+    drawn as a streaming min/max envelope with the same vertex count.
+    """
+
+    def __init__(self, n_channels=32, max_points=1000, sampling_rate=2000, fps=60, parent=None):
+        super().__init__(parent)
+        self.n_channels = n_channels
+        self.max_points = max_points
+        self.sampling_rate = sampling_rate
+        self.time_step = 1.0 / self.sampling_rate
+        self.packet_count = 0
+        self.frames_rendered = 0
+
+        self.canvas = SceneCanvas(keys='interactive', bgcolor='#4A628A', parent=self)
+        self.canvas.events.draw.connect(lambda event: TRACER.present())
+        self.view = self.canvas.central_widget.add_view()
+        self.view.camera = PanZoomCamera(interactive=True)
+
+        self.offsets = (n_channels - 1 - np.arange(n_channels, dtype=np.float32))[:, np.newaxis]
+        self.curve = Line(color='white', width=1.0, parent=self.view.scene, method='gl')
+        self.labels = Text(text=[f"Ch {ch}" for ch in range(n_channels)], color='white', font_size=7,
+                           anchor_x='right', parent=self.view.scene)
+        self.set_window(max_points * self.time_step)
+        print(f"[StackedPlotPanel] {time.strftime('%H:%M:%S')} Initialized canvas, channels: {n_channels}, max_points: {max_points}")
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 50)
+        layout.addWidget(self.canvas.native)
+        self.setMinimumHeight(400)
+
+        self.render_timer = QTimer(self)
+        self.render_timer.timeout.connect(self.render)
+        self.set_fps(fps)
+
+    def set_fps(self, fps: int):
+        self.fps = max(1, int(fps))
+        self.render_timer.start(int(1000 / self.fps))
+
+    def set_stream(self, sampling_rate: float, n_channels: int):
+        # Rows and buffers follow the server's stream, the window keeps its length in seconds
+        if (sampling_rate, n_channels) == (self.sampling_rate, self.n_channels):
+            return
+        seconds = self.window_seconds
+        self.sampling_rate = sampling_rate
+        self.time_step = 1.0 / sampling_rate
+        self.n_channels = n_channels
+        self.offsets = (n_channels - 1 - np.arange(n_channels, dtype=np.float32))[:, np.newaxis]
+        self.labels.text = [f"Ch {ch}" for ch in range(n_channels)]
+        self.set_window(seconds)
+        print(f"[StackedPlotPanel] {time.strftime('%H:%M:%S')} Stream changed, channels: {n_channels}, sampling_rate: {sampling_rate:g} Hz")
+
+    def set_window(self, seconds: float):
+        self.window_seconds = seconds
+        window_samples = max(1, int(round(seconds * self.sampling_rate)))
+        if window_samples <= self.max_points:
+            self.decimator = None
+            self.data = np.zeros((self.n_channels, window_samples), dtype=np.float32)
+            x = np.arange(window_samples) * self.time_step
+            window = window_samples * self.time_step
+        else:
+            self.decimator = StreamingMinMaxDecimator(self.n_channels, window_samples, self.max_points // 2)
+            self.data = np.zeros((self.n_channels, 0), dtype=np.float32)
+            x = self.decimator.x * self.time_step
+            window = self.decimator.window_samples * self.time_step
+        points = len(x)
+        # Render buffers, reused every frame: samples (or min/max columns) in time order,
+        # then scaled and offset. block takes the packets in envelope mode.
+        self.ordered = np.zeros((self.n_channels, points), dtype=np.float32)
+        self.scaled = np.zeros((self.n_channels, points), dtype=np.float32)
+        self.block = np.zeros((self.n_channels, SAMPLES_PER_PACKET), dtype=np.float32)
+        self.row_map = None
+        self.ptr = 0
+        self.dirty = True
+        self.vertices = np.zeros((self.n_channels * points, 2), dtype=np.float32)
+        self.vertices[:, 0] = np.tile(x, self.n_channels)
+        self.vertices[:, 1] = np.repeat(self.offsets[:, 0], points)
+        connect = np.ones(self.n_channels * points, dtype=bool)
+        connect[points - 1::points] = False  # no segment from the last sample of a channel to the next
+        self.curve.set_data(pos=self.vertices, connect=connect)
+        self.labels.pos = np.column_stack((np.full(self.n_channels, -0.02 * window), self.offsets[:, 0]))
+        self.view.camera.set_range(x=(-0.08 * window, window), y=(-1, self.n_channels))
+        self.canvas.update()
+
+    def _rows(self, channels):
+        # (frame rows, plot rows) of a subscription, slices when both are contiguous, which
+        # makes every copy below a plain slice assignment. Cached until the channels change.
+        if self.row_map is None or self.row_map[0] != channels:
+            rows = [i for i, ch in enumerate(channels) if ch < self.n_channels]
+            targets = [channels[i] for i in rows]
+            if rows and rows == list(range(rows[0], rows[-1] + 1)) and targets == list(range(targets[0], targets[-1] + 1)):
+                mapping = (slice(rows[0], rows[-1] + 1), slice(targets[0], targets[-1] + 1))
+            else:
+                mapping = (np.array(rows, dtype=np.intp), np.array(targets, dtype=np.intp))
+            self.row_map = (list(channels), mapping)
+            self.block[:] = 0.0  # rows of channels that are not streamed stay zero
+        return self.row_map[1]
+
+    def update_frame(self, frame: np.ndarray, channels):
+        # (len(channels), n) block, channels missing from the block are not updated (zero in envelope mode)
+        TRACER.stamp("plot")
+        try:
+            n = frame.shape[1]
+            rows, targets = self._rows(channels)
+            self.packet_count += 1
+            size = self.data.shape[1]
+            if self.decimator is not None:
+                if n != self.block.shape[1]:
+                    self.block = np.zeros((self.n_channels, n), dtype=np.float32)
+                    self.row_map = None
+                    rows, targets = self._rows(channels)
+                self.block[targets] = frame[rows]
+                self.decimator.push(self.block)
+            elif n >= size:
+                self.data[targets] = frame[rows, -size:]
+                self.ptr = 0
+            else:
+                # The ring wraps at most once per packet: two slice copies
+                first = min(n, size - self.ptr)
+                self.data[targets, self.ptr:self.ptr + first] = frame[rows, :first]
+                self.data[targets, :n - first] = frame[rows, first:]
+                self.ptr = (self.ptr + n) % size
+            self.dirty = True
+        except Exception as e:
+            print(f"[StackedPlotPanel] {time.strftime('%H:%M:%S')} update_frame error: {e}")
+
+    def render(self):
+        if not self.dirty or not self.isVisible():
+            return
+        self.dirty = False
+        t0 = time.perf_counter()
+        try:
+            ordered = self.ordered
+            if self.decimator is not None:
+                self.decimator.envelope(out=ordered)
+            else:
+                tail = self.data.shape[1] - self.ptr
+                ordered[:, :tail] = self.data[:, self.ptr:]
+                ordered[:, tail:] = self.data[:, :self.ptr]
+            scaled = self.scaled
+            np.abs(ordered, out=scaled)
+            peak = scaled.max(axis=1, keepdims=True)
+            np.multiply(ordered, 0.45 / np.maximum(peak, 1e-6), out=scaled)
+            scaled += self.offsets
+            self.vertices[:, 1] = scaled.ravel()
+            self.curve.set_data(pos=self.vertices)
+            self.canvas.update()
+            self.frames_rendered += 1
+            RENDER_FRAMES.inc()
+            RENDER_SECONDS.observe(time.perf_counter() - t0)
+        except Exception as e:
+            print(f"[StackedPlotPanel] {time.strftime('%H:%M:%S')} render error: {e}")
+
+    def set_color(self, color: str):
+        self.curve.set_data(color=COLOR_MAP.get(color, "lime"))
+        self.canvas.update()
+
+    def reset_buffer(self):
+        self.packet_count = 0
+        self.data[:] = 0.0
+        if self.decimator is not None:
+            self.decimator.reset()
+        self.ptr = 0
+        self.dirty = True
@@ -34,9 +34,30 @@ class StatusLabel(QWidget):
         layout.addSpacing(16)
         layout.addWidget(self.connection_label)
         layout.addWidget(self.connection_light)
+        layout.addSpacing(16)
+        self.metrics_label = QLabel("")
+        layout.addWidget(self.metrics_label)
         layout.addStretch(1)
         self.setContentsMargins(0, 0, 0, 0)
 
     def set_connection(self, is_connected: bool, message: str = ''):
         hexcode = "#00DFA2" if is_connected else "#FF0060"
         self.connection_light.setColor(hexcode)
+
+    def set_metrics(self, metrics: dict):
+        self.metrics_label.setText(
+            f"{metrics['packets_per_s']:.0f} pkt/s  {metrics['bytes_per_s'] / 1e6:.2f} MB/s  "
+            f"{metrics['fps']:.0f} fps  lost {metrics['lost_frames']:.0f}  invalid {metrics['invalid_frames']:.0f}  "
+            f"rx buffer {metrics['receive_buffer_bytes'] / 1024:.0f} KiB  filter p99 {metrics['filter_p99_us']:.0f} us"
+        )
+        latency = metrics.get("latency", {})
+        total = latency.get("total")
+        if total and total["count"]:
+            self.metrics_label.setText(self.metrics_label.text() +
+                                       f"  latency p50 {total['p50_ms']:.1f} ms / p99 {total['p99_ms']:.1f} ms")
+        if metrics.get("recording"):
+            self.metrics_label.setText(self.metrics_label.text() + f"  REC (dropped {metrics['recorder_dropped']:.0f})")
+        # Per-hop breakdown on hover, to tell network, Qt queue and rendering apart
+        self.metrics_label.setToolTip("\n".join(
+            f"{hop}: p50 {s['p50_ms']:.2f} ms, p99 {s['p99_ms']:.2f} ms ({s['count']} samples)"
+            for hop, s in latency.items() if s["count"]))